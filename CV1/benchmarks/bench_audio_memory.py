@@ -0,0 +1,135 @@
+"""
+benchmarks/bench_audio_memory.py
+Peak Python memory and wall time of the audio I/O around one voice turn:
+transcribe_audio (upload) + text_to_speech (synthesis), comparing the old
+temp-file implementation with the in-memory one in utils/ai_engine.
+
+Whisper and gTTS are replaced by local stand-ins that consume / produce the
+same number of bytes, so only our own buffering and disk I/O is measured.
+
+Usage (from CV1/):
+    python benchmarks/bench_audio_memory.py --upload-mb 5 --reply-kb 300 --turns 20
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("METRICS_ENABLED", "0")  # no spans written to the app's database
+
+from utils import ai_engine  # noqa: E402
+from utils.llm_backend import FakeBackend, set_backend  # noqa: E402
+
+
+# ── Local stand-ins ────────────────────────────────────────────────────────────
+def fake_transcribe(model, file, language):
+    file.read()  # the SDK reads the whole upload
+    return SimpleNamespace(text=" transcribed ")
+
+
+class FakeGTTS:
+    reply_bytes = 300 * 1024
+
+    def __init__(self, text, lang, slow=False):
+        self.text = text
+
+    def write_to_fp(self, fp):
+        fp.write(b"\xff" * self.reply_bytes)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            self.write_to_fp(f)
+
+
+class StandInBackend(FakeBackend):
+    """Same in-memory buffering as OpenAIBackend, with the stand-ins above."""
+
+    def transcribe(self, audio_bytes, filename, language, model=None, deadline=None):
+        audio_file = io.BytesIO(audio_bytes)
+        audio_file.name = filename
+        return fake_transcribe(model="whisper-1", file=audio_file, language=language).text.strip()
+
+    def synthesize(self, text, language, deadline=None):
+        buffer = io.BytesIO()
+        FakeGTTS(text=text, lang=language).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+# ── Previous implementation (temp files), kept for comparison ──────────────────
+def legacy_transcribe(audio_bytes, language="en"):
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+        tmp.write(audio_bytes)
+        tmp_path = tmp.name
+    try:
+        with open(tmp_path, "rb") as audio_file:
+            transcript = fake_transcribe(model="whisper-1", file=audio_file, language=language)
+        return transcript.text.strip()
+    finally:
+        os.unlink(tmp_path)
+
+
+def legacy_tts(text, language="en"):
+    tts = FakeGTTS(text=text, lang=language)
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
+        tts.save(tmp.name)
+        tmp_path = tmp.name
+    try:
+        with open(tmp_path, "rb") as f:
+            return f.read()
+    finally:
+        os.unlink(tmp_path)
+
+
+def current_transcribe(audio_bytes, language="en"):
+    return ai_engine._whisper(audio_bytes, "audio.wav", language)  # bypass preprocessing / cache
+
+
+def current_tts(text, language="en"):
+    return ai_engine._synthesize(text, language)  # bypass the TTS cache
+
+
+# ── Harness ────────────────────────────────────────────────────────────────────
+def measure(transcribe, tts, audio_bytes, turns):
+    peaks, times = [], []
+    for _ in range(turns):
+        tracemalloc.start()
+        started = time.perf_counter()
+        transcribe(audio_bytes)
+        tts("reply text")
+        times.append(time.perf_counter() - started)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    times.sort()
+    return {
+        "peak_kb": max(peaks) / 1024,
+        "median_ms": times[len(times) // 2] * 1000,
+        "max_ms": times[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--upload-mb", type=float, default=5.0)
+    parser.add_argument("--reply-kb", type=float, default=300.0)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    set_backend(StandInBackend())
+    FakeGTTS.reply_bytes = int(args.reply_kb * 1024)
+    audio_bytes = os.urandom(int(args.upload_mb * 1024 * 1024))
+
+    print(f"upload={args.upload_mb} MB  reply={args.reply_kb} KB  turns={args.turns}")
+    print(f"{'path':<10}{'peak KB':>12}{'median ms':>12}{'max ms':>10}")
+    for name, transcribe, tts in (("temp-file", legacy_transcribe, legacy_tts),
+                                  ("in-memory", current_transcribe, current_tts)):
+        r = measure(transcribe, tts, audio_bytes, args.turns)
+        print(f"{name:<10}{r['peak_kb']:>12.0f}{r['median_ms']:>12.2f}{r['max_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+benchmarks/bench_audio_preprocess.py
+Bytes sent to Whisper and end-to-end transcription latency, raw upload vs
+utils/audio.preprocess_audio.
+
+Usage (from CV1/):
+    python benchmarks/bench_audio_preprocess.py recording1.wav voicemail.m4a
+    python benchmarks/bench_audio_preprocess.py --live recording.wav   # real Whisper calls
+
+Without files, a synthetic 48 kHz stereo WAV (speech-like bursts framed by
+silence) is generated. Without --live only sizes and preprocessing time are
+reported.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.audio import preprocess_audio  # noqa: E402
+
+
+def synthetic_wav(seconds: float = 30.0, rate: int = 48000, lead_silence: float = 3.0) -> bytes:
+    t = np.arange(int(seconds * rate)) / rate
+    voice = 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.7 * t) > 0)
+    voice[: int(lead_silence * rate)] = 0
+    voice[-int(lead_silence * rate):] = 0
+    stereo = np.stack([voice, voice * 0.9], axis=1).astype(np.float32)
+    buffer = io.BytesIO()
+    sf.write(buffer, stereo, rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def whisper_ms(audio_bytes: bytes, filename: str) -> float:
+    import openai
+    audio_file = io.BytesIO(audio_bytes)
+    audio_file.name = filename
+    started = time.perf_counter()
+    openai.audio.transcriptions.create(model="whisper-1", file=audio_file)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--live", action="store_true", help="also time real Whisper calls")
+    args = parser.parse_args()
+
+    inputs = [(path, open(path, "rb").read()) for path in args.files] or [("synthetic.wav", synthetic_wav())]
+
+    for name, raw in inputs:
+        processed, new_name, stats = preprocess_audio(raw, name)
+        print(f"\n{name}")
+        print(f"  bytes      {len(raw):>10,} → {len(processed):>10,}  ({1 - len(processed) / len(raw):.0%} smaller)")
+        if "processed_seconds" in stats:
+            print(f"  duration   {stats['original_seconds']:>9.1f}s → {stats['processed_seconds']:>9.1f}s")
+        print(f"  preprocess {stats['preprocess_ms']:>9.1f} ms" + (f"  [skipped: {stats['skipped']}]" if "skipped" in stats else ""))
+        if args.live:
+            raw_ms = whisper_ms(raw, name)
+            new_ms = whisper_ms(processed, new_name) + stats["preprocess_ms"]
+            print(f"  end-to-end {raw_ms:>9.0f} ms → {new_ms:>9.0f} ms (incl. preprocessing)")
+
+
+if __name__ == "__main__":
+    main()
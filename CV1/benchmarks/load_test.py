@@ -0,0 +1,274 @@
+"""
+benchmarks/load_test.py
+Many concurrent simulated support sessions driving the real turn logic
+(utils/turns.chat_turn / voice_turn: SQLite writes, context building,
+streamed reply, sentence TTS, Sheets outbox) against local stand-ins for
+OpenAI, gTTS (utils/llm_backend.FakeBackend) and gspread
+(utils/fake_gspread.FakeClient).
+
+Reports p50/p95/p99 turn latency, throughput, SQLite write-lock wait,
+memory and outbox drain time, and saves them as JSON so runs can be compared
+across releases.
+
+Usage (from CV1/):
+    python benchmarks/load_test.py --sessions 50 --turns 4 --voice-ratio 0.3
+    python benchmarks/load_test.py --llm-latency-ms 400 --tokens-per-second 40 --write-behind
+    python benchmarks/load_test.py --output results/v2.json --compare results/v1.json
+
+Each session runs on its own thread, as Streamlit runs each browser session.
+Everything (database, TTS cache) lives in a temporary directory.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix="ott-loadtest-")
+os.environ["TTS_CACHE_DIR"] = os.path.join(WORKDIR, "tts_cache")
+os.environ.setdefault("GOOGLE_SHEET_ID", "load-test-sheet")
+
+from utils import database, metrics  # noqa: E402
+from utils.llm_backend import FakeBackend, set_backend  # noqa: E402
+from utils.fake_gspread import FakeClient  # noqa: E402
+from utils.sheets import set_sheet_client, start_outbox_worker, stop_outbox_worker  # noqa: E402
+from utils.turns import chat_turn, voice_turn  # noqa: E402
+
+database.DB_PATH = os.path.join(WORKDIR, "conversations.db")   # before any span is flushed
+
+PROMPTS = {
+    "en": ["My stream keeps buffering on the smart TV", "How do I change my subscription plan?",
+           "I was charged twice this month", "I can't log in after resetting my password",
+           "Can I download movies to watch offline?", "How do I set up parental controls?"],
+    "ar": ["البث يتوقف باستمرار على التلفاز الذكي", "كيف أغير خطة الاشتراك؟",
+           "تم خصم المبلغ مرتين هذا الشهر", "لا أستطيع تسجيل الدخول بعد إعادة تعيين كلمة المرور"],
+}
+
+RESULT_KEYS = ("throughput_turns_per_s", "chat_turn_ms.p50", "chat_turn_ms.p95", "chat_turn_ms.p99",
+               "chat_ttft_ms.p95", "voice_turn_ms.p95", "voice_first_audio_ms.p95",
+               "sqlite.lock_wait_ms_max", "memory.peak_rss_mb", "sheets.drain_seconds")
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = np.sort(np.asarray(values, dtype=float))
+    return {
+        "count": len(ordered),
+        "mean": float(ordered.mean()),
+        "p50": float(np.percentile(ordered, 50)),
+        "p95": float(np.percentile(ordered, 95)),
+        "p99": float(np.percentile(ordered, 99)),
+        "max": float(ordered[-1]),
+    }
+
+
+def voice_clip(seed: int, seconds: float = 3.0, rate: int = 16000) -> bytes:
+    """Short speech-like WAV; distinct per seed so the transcript cache misses."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    voice = 0.3 * np.sin(2 * np.pi * rng.uniform(150, 300) * t) * (np.sin(2 * np.pi * 1.5 * t) > 0)
+    voice += rng.normal(0, 0.002, len(t))
+    buffer = io.BytesIO()
+    sf.write(buffer, voice.astype(np.float32), rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def run_session(index: int, args, samples: dict, lock: threading.Lock):
+    rng = random.Random(index)
+    language = "ar" if rng.random() < args.arabic_ratio else "en"
+    mode = "voice" if rng.random() < args.voice_ratio else "chat"
+    session_id = f"load-{uuid.uuid4()}"
+    database.create_session(session_id, language, mode)
+    history = []
+    for turn in range(args.turns):
+        started = time.perf_counter()
+        result = {}
+        try:
+            if mode == "chat":
+                prompt = f"{rng.choice(PROMPTS[language])} (#{index}-{turn})"
+                for _ in chat_turn(session_id, history, prompt, language, result):
+                    pass
+                first = result["timings"].get("ttft_ms")
+            else:
+                clip = voice_clip(index * 1000 + turn)
+                for _ in voice_turn(session_id, history, clip, "clip.wav", language, result):
+                    pass
+                first = result["timings"].get("first_audio_ms")
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                samples[f"{mode}_turn_ms"].append(elapsed)
+                samples["chat_ttft_ms" if mode == "chat" else "voice_first_audio_ms"].append(first)
+        except Exception as e:
+            with lock:
+                samples["errors"].append(f"{type(e).__name__}: {e}")
+        if args.think_ms:
+            time.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+
+def wait_for_outbox(timeout: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if database.get_outbox_stats()["pending"] == 0:
+            return time.perf_counter() - started
+        time.sleep(0.05)
+    return float("nan")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=4, help="turns per session")
+    parser.add_argument("--voice-ratio", type=float, default=0.3)
+    parser.add_argument("--arabic-ratio", type=float, default=0.3)
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a session's turns")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--tokens-per-second", type=float, default=60)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--sheets-latency-ms", type=float, default=150)
+    parser.add_argument("--write-behind", action="store_true", help="enable the DB write-behind queue")
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace Python allocations (slower)")
+    parser.add_argument("--output", default=None, help="JSON results path")
+    parser.add_argument("--compare", default=None, help="previous JSON results to diff against")
+    args = parser.parse_args()
+
+    database.init_db()
+    if args.write_behind:
+        database.enable_write_behind(True)
+    backend = FakeBackend(latency=args.llm_latency_ms / 1000, jitter=args.llm_jitter_ms / 1000,
+                          tokens_per_second=args.tokens_per_second, error_rate=args.llm_error_rate)
+    set_backend(backend)
+    sheets = FakeClient(latency=args.sheets_latency_ms / 1000)
+    set_sheet_client(sheets)
+    start_outbox_worker(poll_interval=0.2)
+
+    samples = {"chat_turn_ms": [], "chat_ttft_ms": [], "voice_turn_ms": [],
+               "voice_first_audio_ms": [], "errors": []}
+    lock = threading.Lock()
+    database.get_lock_wait_stats(reset=True)
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    wall_started = time.time()
+    print(f"{args.sessions} sessions × {args.turns} turns, voice {args.voice_ratio:.0%}, "
+          f"LLM {args.llm_latency_ms:.0f}±{args.llm_jitter_ms:.0f} ms, workdir {WORKDIR}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="session") as pool:
+        for future in [pool.submit(run_session, i, args, samples, lock) for i in range(args.sessions)]:
+            future.result()
+    database.flush_writes()
+    elapsed = time.perf_counter() - started
+    drain = wait_for_outbox(timeout=60)
+    stop_outbox_worker(timeout=5)
+    metrics.flush()
+
+    locks = database.get_lock_wait_stats()
+    turns = len(samples["chat_turn_ms"]) + len(samples["voice_turn_ms"])
+    results = {
+        "turns": turns,
+        "errors": len(samples["errors"]),
+        "wall_seconds": elapsed,
+        "throughput_turns_per_s": turns / elapsed,
+        "chat_turn_ms": percentiles(samples["chat_turn_ms"]),
+        "chat_ttft_ms": percentiles([v for v in samples["chat_ttft_ms"] if v is not None]),
+        "voice_turn_ms": percentiles(samples["voice_turn_ms"]),
+        "voice_first_audio_ms": percentiles([v for v in samples["voice_first_audio_ms"] if v is not None]),
+        "sqlite": {
+            "write_transactions": locks["transactions"],
+            "lock_wait_ms_total": locks["wait_seconds"] * 1000,
+            "lock_wait_ms_mean": locks["wait_seconds"] * 1000 / max(locks["transactions"], 1),
+            "lock_wait_ms_max": locks["max_wait_seconds"] * 1000,
+        },
+        "memory": {
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "rss_growth_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - rss_before,
+        },
+        "llm_backend": backend.stats(),
+        "sheets": {"api_calls": sheets.calls, "drain_seconds": drain},
+        "stages": {r["stage"]: {k: r[k] for k in ("count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms")}
+                   for r in database.get_stage_latency(wall_started)},
+    }
+    if args.tracemalloc:
+        results["memory"]["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    print(f"\n{turns} turns in {elapsed:.1f}s → {results['throughput_turns_per_s']:.1f} turns/s, "
+          f"{results['errors']} errors")
+    print(f"{'metric':<22}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for key in ("chat_turn_ms", "chat_ttft_ms", "voice_turn_ms", "voice_first_audio_ms"):
+        r = results[key]
+        if r["count"]:
+            print(f"{key:<22}{r['count']:>6}{r['p50']:>10.0f}{r['p95']:>10.0f}{r['p99']:>10.0f}{r['max']:>10.0f}")
+    print("stage spans (ms)")
+    for stage, r in results["stages"].items():
+        print(f"  {stage:<20}{r['count']:>6}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}")
+    sq = results["sqlite"]
+    print(f"SQLite: {sq['write_transactions']} write txns, lock wait total {sq['lock_wait_ms_total']:.0f} ms, "
+          f"mean {sq['lock_wait_ms_mean']:.2f} ms, max {sq['lock_wait_ms_max']:.1f} ms")
+    print(f"Memory: peak RSS {results['memory']['peak_rss_mb']:.0f} MB "
+          f"(+{results['memory']['rss_growth_mb']:.0f} MB during the run)")
+    print(f"Sheets: outbox drained {drain:.2f}s after load, {sheets.calls} API calls; "
+          f"LLM backend: {backend.stats()}")
+    for error in samples["errors"][:5]:
+        print(f"  error: {error}")
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                         f"load_test-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": git_revision(),
+                     "python": platform.python_version(), "args": vars(args)},
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = flatten(json.load(f)["results"])
+        after = flatten(results)
+        print(f"\nvs {args.compare}")
+        for key in RESULT_KEYS:
+            if key in before and key in after and before[key]:
+                change = (after[key] - before[key]) / before[key]
+                print(f"  {key:<28}{before[key]:>10.1f} → {after[key]:>10.1f}  ({change:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+cli.py
+Headless maintenance and batch commands (run from CV1/).
+
+    python cli.py ingest voicemails/2024-06-01 --workers 4 --max-inflight 8
+    python cli.py reclassify-language --dry-run
+    python cli.py fts-backfill
+    python cli.py export --tables messages sessions --format jsonl --start 2024-06-01
+    python cli.py check-backend
+
+ingest checkpoints every stored voicemail by content hash (ingested_files
+table), so re-running the same command resumes where it stopped and files
+that failed are retried.
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".webm", ".flac")
+
+
+# ── ingest: voicemail directory → transcript + reply → DB ──────────────────────
+def _init_ingest_worker(api_slots):
+    # Every backend request attempt (each Whisper chunk, each chat call) takes
+    # a slot from the semaphore shared by all workers; decoding and the other
+    # CPU work between requests do not hold one.
+    from utils.llm_backend import get_backend
+    get_backend().use_slots(api_slots)
+
+
+def _ingest_file(path: str, file_hash: str, language: str) -> dict:
+    """Worker: transcribe one voicemail and draft the support reply."""
+    from utils.ai_engine import transcribe_audio, chat_with_gpt, detect_language
+
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        audio_bytes = f.read()
+    stats = {}
+    user_text = transcribe_audio(audio_bytes, language, filename=os.path.basename(path), stats=stats)
+    if not user_text:
+        raise ValueError("empty transcript")
+    active_lang = detect_language(user_text)
+    chat_started = time.perf_counter()
+    reply = chat_with_gpt([{"role": "user", "content": user_text}], active_lang)
+    return {
+        "file_hash": file_hash,
+        "path": path,
+        "session_id": f"voicemail-{file_hash[:16]}",
+        "language": active_lang,
+        "user_text": user_text,
+        "reply": reply,
+        "audio_seconds": stats.get("processed_seconds", 0.0),
+        "transcribe_ms": stats.get("transcribe_ms", 0.0),
+        "chat_ms": (time.perf_counter() - chat_started) * 1000,
+        "total_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def _find_audio_files(directory: str) -> list:
+    found = []
+    for root, _, names in os.walk(directory):
+        found.extend(os.path.join(root, n) for n in names if n.lower().endswith(AUDIO_EXTENSIONS))
+    return sorted(found)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def cmd_ingest(args) -> int:
+    from utils.database import init_db, get_ingested_hashes, save_ingested_batch
+    from utils.sheets import sheets_enabled
+
+    init_db()
+    files = _find_audio_files(args.directory)
+    done = get_ingested_hashes()
+    todo, seen, skipped = [], set(), 0
+    for path in files:
+        file_hash = _file_hash(path)
+        if file_hash in done or file_hash in seen:
+            skipped += 1
+            continue
+        seen.add(file_hash)
+        todo.append((path, file_hash))
+    print(f"{len(files)} audio files, {skipped} already ingested or duplicate, {len(todo)} to process")
+    if not todo:
+        return 0
+
+    outbox = sheets_enabled()
+    pending, failures, results = [], [], []
+    stored = 0
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal stored
+        if pending:
+            stored += save_ingested_batch(pending, outbox=outbox)
+            pending.clear()
+
+    # spawn: workers must not inherit the parent's open SQLite connections.
+    ctx = multiprocessing.get_context("spawn")
+    api_slots = ctx.BoundedSemaphore(args.max_inflight)
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx,
+                             initializer=_init_ingest_worker, initargs=(api_slots,)) as pool:
+        futures = {pool.submit(_ingest_file, path, file_hash, args.language): path
+                   for path, file_hash in todo}
+        try:
+            for i, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures.append((path, f"{type(e).__name__}: {e}"))
+                else:
+                    results.append(result)
+                    pending.append(result)
+                    if len(pending) >= args.batch_size:
+                        flush()
+                if i % args.progress_every == 0:
+                    rate = i / (time.perf_counter() - started)
+                    print(f"  {i}/{len(todo)} done ({rate * 60:.1f} files/min, {len(failures)} failed)")
+        except KeyboardInterrupt:
+            print("Interrupted; saving completed files (re-run to resume).")
+            for future in futures:
+                future.cancel()
+        finally:
+            flush()
+
+    elapsed = time.perf_counter() - started
+    audio_seconds = sum(r["audio_seconds"] for r in results)
+    print(f"\nStored {stored} voicemails in {elapsed:.1f}s "
+          f"({stored / elapsed * 60:.1f} files/min, {audio_seconds / elapsed:.1f}x real time)")
+    if results:
+        for label, key in (("transcribe", "transcribe_ms"), ("chat", "chat_ms"), ("per file", "total_ms")):
+            values = [r[key] for r in results]
+            print(f"  {label:<11} p50 {_percentile(values, 0.5):>7.0f} ms   p95 {_percentile(values, 0.95):>7.0f} ms")
+    if failures:
+        print(f"{len(failures)} failed (not checkpointed, retried on the next run):")
+        for path, error in failures:
+            print(f"  {path}: {error}")
+        return 1
+    return 0
+
+
+# ── reclassify-language: re-run language detection over stored messages ───────
+def cmd_reclassify_language(args) -> int:
+    from utils.database import init_db, get_message_languages_after, update_message_languages
+    from utils.text import detect_languages
+
+    init_db()
+    started = time.perf_counter()
+    last_id, scanned, changed = 0, 0, {}
+    while True:
+        rows = get_message_languages_after(last_id, args.chunk_size)
+        if not rows:
+            break
+        detected = detect_languages([content for _, content, _ in rows])
+        updates = []
+        for (msg_id, _, old), new in zip(rows, detected):
+            if new != old:
+                updates.append((new, msg_id))
+                changed[(old, new)] = changed.get((old, new), 0) + 1
+        if not args.dry_run:
+            update_message_languages(updates)
+        scanned += len(rows)
+        last_id = rows[-1][0]
+
+    elapsed = time.perf_counter() - started
+    total = sum(changed.values())
+    verb = "would change" if args.dry_run else "changed"
+    print(f"Scanned {scanned} messages in {elapsed:.2f}s ({scanned / max(elapsed, 1e-9):,.0f}/s), {verb} {total}")
+    for (old, new), count in sorted(changed.items()):
+        print(f"  {old or '∅'} → {new}: {count}")
+    return 0
+
+
+# ── fts-backfill: index messages stored before the search index existed ───────
+def cmd_fts_backfill(args) -> int:
+    from utils.database import init_db, backfill_fts, fts_backfill_status
+
+    init_db()
+    status = fts_backfill_status()
+    print(f"{status['pending']} messages waiting to be indexed")
+    started, total = time.perf_counter(), 0
+    while True:
+        indexed = backfill_fts(batch_size=args.batch_size, max_batches=1)
+        if not indexed:
+            break
+        total += indexed
+        rate = total / (time.perf_counter() - started)
+        print(f"  indexed {total} ({rate:,.0f}/s), up to message #{fts_backfill_status()['indexed_upto']}")
+    print(f"Done: {total} messages indexed in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+# ── export: snapshot the database and stream tables to compressed files ───────
+def cmd_export(args) -> int:
+    from utils.database import init_db
+    from utils.export import export_database, export_table, open_snapshot
+
+    init_db()
+    started = time.perf_counter()
+    if args.format == "sqlite":
+        path = export_database(args.out_dir)
+        print(f"{path}  ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+    else:
+        with open_snapshot(args.out_dir) as snap:
+            for table in args.tables:
+                path, rows = export_table(snap, table, args.format, args.out_dir, args.start, args.end)
+                print(f"{path}  {rows} rows ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+# ── check-backend: construct the production backend without calling it ────────
+def cmd_check_backend(args) -> int:
+    from utils.llm_backend import OpenAIBackend
+
+    try:
+        backend = OpenAIBackend(api_key=os.getenv("OPENAI_API_KEY") or "x")
+    except Exception as e:
+        print(f"OpenAIBackend cannot be constructed: {type(e).__name__}: {e}")
+        return 1
+    print(f"OpenAIBackend OK (timeout {backend.timeout:.0f}s, {backend.max_concurrency} request slots)")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="OTT Support Assistant command-line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="transcribe and answer a directory of voicemails")
+    ingest.add_argument("directory")
+    ingest.add_argument("--language", choices=["en", "ar"], default="en",
+                        help="Whisper language hint (stored language is detected from the transcript)")
+    ingest.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="worker processes (audio decoding is CPU-bound)")
+    ingest.add_argument("--max-inflight", type=int, default=8,
+                        help="concurrent OpenAI requests across all workers")
+    ingest.add_argument("--batch-size", type=int, default=25, help="voicemails per DB transaction")
+    ingest.add_argument("--progress-every", type=int, default=10)
+    ingest.set_defaults(func=cmd_ingest)
+
+    reclassify = commands.add_parser("reclassify-language",
+                                     help="recompute messages.language from the message text")
+    reclassify.add_argument("--chunk-size", type=int, default=5000, help="messages per read/update batch")
+    reclassify.add_argument("--dry-run", action="store_true", help="report changes without writing")
+    reclassify.set_defaults(func=cmd_reclassify_language)
+
+    fts = commands.add_parser("fts-backfill", help="index existing messages for dashboard search (resumable)")
+    fts.add_argument("--batch-size", type=int, default=5000, help="messages per transaction")
+    fts.set_defaults(func=cmd_fts_backfill)
+
+    from utils.export import EXPORT_TABLES, EXPORT_FORMATS
+    export = commands.add_parser("export", help="consistent snapshot export of the conversation tables")
+    export.add_argument("--tables", nargs="+", choices=list(EXPORT_TABLES), default=list(EXPORT_TABLES))
+    export.add_argument("--format", choices=[*EXPORT_FORMATS, "sqlite"], default="csv",
+                        help="csv / jsonl are gzip-compressed; parquet needs pyarrow; sqlite copies the whole DB")
+    export.add_argument("--start", help="only rows on/after this date (YYYY-MM-DD)")
+    export.add_argument("--end", help="only rows before this date (YYYY-MM-DD)")
+    export.add_argument("--out-dir", default=None, help="output directory (default data/exports)")
+    export.set_defaults(func=cmd_export)
+
+    check = commands.add_parser("check-backend",
+                                help="smoke check: the OpenAI backend can be constructed (no API call)")
+    check.set_defaults(func=cmd_check_backend)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,11 +3,8 @@ pages/chat_page.py
 Chat support interface with English/Arabic support.
 """
 import streamlit as st
-from utils.ai_engine import chat_with_gpt, detect_language
-from utils.database import create_session, save_message, get_session_messages
-from utils.sheets import append_single_message
-from utils.database import get_connection
-from datetime import datetime
+from utils.database import create_session, get_session_messages
+from utils.turns import chat_turn
 
 LABELS = {
     "en": {
@@ -36,14 +33,6 @@ LABELS = {
     }
 }
 
-def get_last_message_id():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT MAX(id) FROM messages")
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] or 0
-
 def render_chat(language: str, session_id: str):
     lbl = LABELS[language]
 
@@ -76,43 +65,14 @@ def render_chat(language: str, session_id: str):
 
     # Chat input
     if prompt := st.chat_input(lbl["placeholder"]):
-        # Auto-detect language from input
-        detected_lang = detect_language(prompt)
-        active_lang = detected_lang if detected_lang != language else language
-
         # Display user message
         with st.chat_message("user"):
             st.markdown(prompt)
-        st.session_state.messages.append({"role": "user", "content": prompt})
-
-        # Save user message to DB
-        save_message(session_id, "user", prompt, active_lang, "chat")
 
-        # Get AI response
+        # Save both messages, stream the AI response token by token and
+        # record the turn timing (utils/turns.py)
         with st.chat_message("assistant"):
-            with st.spinner(lbl["thinking"]):
-                reply = chat_with_gpt(
-                    [{"role": m["role"], "content": m["content"]} for m in st.session_state.messages],
-                    active_lang
-                )
-            st.markdown(reply)
-
-        st.session_state.messages.append({"role": "assistant", "content": reply})
-
-        # Save assistant message to DB
-        save_message(session_id, "assistant", reply, active_lang, "chat")
-
-        # Real-time sync to Google Sheets (best effort)
-        msg_id = get_last_message_id()
-        append_single_message({
-            "id": msg_id,
-            "session_id": session_id,
-            "role": "assistant",
-            "content": reply,
-            "language": active_lang,
-            "mode": "chat",
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+            st.write_stream(chat_turn(session_id, st.session_state.messages, prompt, language))
 
     # ── Footer actions ────────────────────────────────────────────────────────
     st.markdown("---")
@@ -132,8 +92,7 @@ def render_chat(language: str, session_id: str):
         # Manual sync button
         if st.button(lbl["sync"]):
             from utils.sheets import sync_messages_to_sheet
-            from utils.database import get_all_messages_flat
-            result = sync_messages_to_sheet(get_all_messages_flat())
+            result = sync_messages_to_sheet()
             if result["success"]:
                 st.success(f"{lbl['sync_success']} ({result['synced']} rows)")
             else:
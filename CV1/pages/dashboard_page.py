@@ -1,30 +1,79 @@
 """
 pages/dashboard_page.py
 Admin dashboard showing conversation analytics.
+
+Database reads go through cached(): results are shared by all reruns and
+admin sessions until the next conversation write (database.get_write_generation;
+metrics, cache and sync bookkeeping do not count) or DASHBOARD_CACHE_TTL.
 """
 import streamlit as st
 import sqlite3
 import os
-from utils.database import get_all_sessions, get_all_messages_flat, DB_PATH
+import time
+from datetime import datetime, timedelta
+from utils.database import (get_message_stats, get_sessions_page,
+                            get_messages_page, get_turn_timing_summary, get_outbox_stats,
+                            search_messages, fts_backfill_status, get_stage_latency, get_write_generation)
+
+PAGE_SIZES = [25, 50, 100, 250]
+# Stage latency windows: label -> seconds (the chart uses 24 buckets per window)
+LATENCY_WINDOWS = {"Last 15 min": 900, "Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400}
+# Backstop for writes the generation counter cannot see (other processes, e.g. cli.py)
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "60"))
+# Download buttons hold the whole file in server memory; bigger exports are left on disk
+DASHBOARD_DOWNLOAD_MAX_MB = float(os.getenv("DASHBOARD_DOWNLOAD_MAX_MB", "200"))
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, max_entries=500, show_spinner=False)
+def _query(name: str, generation: int, kwargs: tuple):
+    from utils import database
+    return getattr(database, name)(**dict(kwargs))
+
+def cached(fetch):
+    """Keyword-only wrapper of a utils.database read, cached per write generation."""
+    def run(**kwargs):
+        return _query(fetch.__name__, get_write_generation(), tuple(sorted(kwargs.items())))
+    return run
+
+def _pager(key: str, fetch, page_size: int, **filters):
+    """
+    Fetch one keyset page and render Prev/Next controls for it.
+    The stack of cursors lives in session_state and is reset when filters change.
+    """
+    cursors_key, filters_key = f"{key}_cursors", f"{key}_filters"
+    if st.session_state.get(filters_key) != (page_size, filters):
+        st.session_state[filters_key] = (page_size, filters)
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+
+    rows, next_cursor = fetch(limit=page_size, cursor=cursors[-1], **filters)
+
+    prev_col, info_col, next_col = st.columns([1, 4, 1])
+    if prev_col.button("◀ Prev", key=f"{key}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    info_col.caption(f"Page {len(cursors)}")
+    if next_col.button("Next ▶", key=f"{key}_next", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+    return rows
 
 def render_dashboard():
     st.title("📊 Conversation Dashboard")
     st.markdown("---")
 
-    sessions = get_all_sessions()
-    messages = get_all_messages_flat()
+    stats = cached(get_message_stats)()
 
-    if not sessions:
+    if not stats["total_sessions"]:
         st.info("No conversations yet. Start a support chat to see data here.")
         return
 
     # ── KPI cards ──────────────────────────────────────────────────────────────
-    total_sessions = len(sessions)
-    total_messages = len(messages)
-    en_msgs = sum(1 for m in messages if m.get("language") == "en")
-    ar_msgs = sum(1 for m in messages if m.get("language") == "ar")
-    voice_msgs = sum(1 for m in messages if m.get("mode") == "voice")
-    chat_msgs = sum(1 for m in messages if m.get("mode") == "chat")
+    total_sessions = stats["total_sessions"]
+    total_messages = stats["total_messages"]
+    en_msgs = stats["by_language"].get("en", 0)
+    ar_msgs = stats["by_language"].get("ar", 0)
+    voice_msgs = stats["by_mode"].get("voice", 0)
+    chat_msgs = stats["by_mode"].get("chat", 0)
 
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Total Sessions", total_sessions)
@@ -36,21 +85,138 @@ def render_dashboard():
     col5.metric("💬 Chat Messages", chat_msgs)
     col6.metric("🎙️ Voice Messages", voice_msgs)
 
+    # ── Response latency (last 24h) ────────────────────────────────────────────
+    # Whole minutes, so reruns within a minute share a cache entry
+    since = (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:00")
+    chat_timing = cached(get_turn_timing_summary)(since=since).get("chat")
+    if chat_timing:
+        col7, col8, col9 = st.columns(3)
+        col7.metric("⏱️ Avg Time to First Token (24h)", f"{chat_timing['avg_ttft_ms'] or 0:.0f} ms")
+        col8.metric("⏱️ Avg Full Reply (24h)", f"{chat_timing['avg_total_ms'] or 0:.0f} ms")
+        col9.metric("Streamed Turns (24h)", chat_timing["turns"])
+
+    # ── Stage latency (utils/metrics spans) ───────────────────────────────────
+    with st.expander("⏱️ Latency by Stage"):
+        l1, l2 = st.columns(2)
+        window = LATENCY_WINDOWS[l1.selectbox("Window", list(LATENCY_WINDOWS), index=1)]
+        stage_mode = {"All": None, "💬 Chat": "chat", "🎙️ Voice": "voice"}[
+            l2.selectbox("Turn mode", ["All", "💬 Chat", "🎙️ Voice"], key="latency_mode")]
+        since = time.time() // 60 * 60 - window
+        stages = cached(get_stage_latency)(since=since, mode=stage_mode)
+        if stages:
+            import pandas as pd
+            df_stages = pd.DataFrame(stages).drop(columns="bucket")
+            st.dataframe(df_stages.round(1), use_container_width=True, hide_index=True)
+            series = pd.DataFrame(cached(get_stage_latency)(since=since, mode=stage_mode,
+                                                            bucket_seconds=window / 24))
+            series["bucket"] = pd.to_datetime(series["bucket"], unit="s")
+            st.caption("p95 per stage (ms)")
+            st.line_chart(series.pivot(index="bucket", columns="stage", values="p95_ms"))
+        else:
+            st.caption("No stage timings recorded in this window (METRICS_ENABLED=0 turns them off).")
+
+    # ── Slowest reruns (utils/profiler, PROFILE_RERUNS=1) ─────────────────────
+    from utils.profiler import PROFILE_RERUNS, list_profiles, profile_report
+    profiles = list_profiles(limit=20)
+    if PROFILE_RERUNS or profiles:
+        with st.expander("🐢 Slowest Reruns (profiled)"):
+            if not profiles:
+                st.caption("No rerun has been slower than PROFILE_MIN_MS yet.")
+            else:
+                import pandas as pd
+                df_profiles = pd.DataFrame(profiles)
+                df_profiles["recorded_at"] = pd.to_datetime(df_profiles["recorded_at"], unit="s")
+                st.dataframe(df_profiles[["page", "duration_ms", "recorded_at"]],
+                             use_container_width=True, hide_index=True)
+                labels = [f"{p['page']} · {p['duration_ms']} ms · {os.path.basename(p['path'])}"
+                          for p in profiles]
+                chosen = profiles[labels.index(st.selectbox("Profile", labels))]
+                st.code(profile_report(chosen["path"]), language=None)
+                with open(chosen["path"], "rb") as f:
+                    st.download_button("Download .prof (view with snakeviz)", data=f,
+                                       file_name=os.path.basename(chosen["path"]),
+                                       mime="application/octet-stream")
+
+    from utils.ai_engine import get_response_cache_stats
+    cache = get_response_cache_stats()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("⚡ Reply Cache Hits", cache["hits"])
+    c2.metric("Reply Cache Misses", cache["misses"])
+    c3.metric("Reply Cache Hit Rate", f"{cache['hit_rate']:.0%}")
+
+    from utils.ai_engine import get_transcription_cache_stats
+    transcripts = get_transcription_cache_stats()
+    w1, w2, w3 = st.columns(3)
+    w1.metric("🎧 Transcript Cache Hits", transcripts["hits"])
+    w2.metric("Whisper Calls (cache misses)", transcripts["misses"])
+    w3.metric("Transcript Cache Hit Rate", f"{transcripts['hit_rate']:.0%}")
+
+    from utils.ai_engine import get_tts_cache_stats, prewarm_tts_cache
+    tts = get_tts_cache_stats()
+    t1, t2, t3 = st.columns(3)
+    t1.metric("🔊 Voice Cache Hit Rate", f"{tts['hit_rate']:.0%}")
+    t2.metric("Voice Bytes Saved", f"{tts['bytes_saved'] / 1024:.0f} KB")
+    t3.metric("Voice Cache Size", f"{tts['disk_bytes'] / 1024 / 1024:.1f} MB")
+    if st.button("🔥 Pre-warm voice cache with common phrases"):
+        with st.spinner("Synthesizing..."):
+            added = prewarm_tts_cache()
+        st.success(f"✅ Added {added} phrases to the voice cache.")
+
+    st.markdown("---")
+
+    # ── Filters ────────────────────────────────────────────────────────────────
+    f1, f2, f3, f4, f5 = st.columns(5)
+    language = {"All": None, "🇬🇧 English": "en", "🇸🇦 Arabic": "ar"}[
+        f1.selectbox("Language", ["All", "🇬🇧 English", "🇸🇦 Arabic"])]
+    mode = {"All": None, "💬 Chat": "chat", "🎙️ Voice": "voice"}[
+        f2.selectbox("Mode", ["All", "💬 Chat", "🎙️ Voice"])]
+    date_from = f3.date_input("From", value=None)
+    date_to = f4.date_input("To", value=None)
+    page_size = f5.selectbox("Rows per page", PAGE_SIZES, index=1)
+    filters = {
+        "language": language,
+        "mode": mode,
+        "start": date_from.isoformat() if date_from else None,
+        "end": (date_to + timedelta(days=1)).isoformat() if date_to else None,
+    }
+
+    # ── Full-text search ───────────────────────────────────────────────────────
+    st.subheader("🔎 Search Conversations")
+    query = st.text_input("Search messages", placeholder="e.g. refund, reset password, إلغاء الاشتراك",
+                          label_visibility="collapsed")
+    if query.strip():
+        hits = _pager("dash_search", cached(search_messages), page_size, query=query, **filters)
+        if hits:
+            import pandas as pd
+            st.dataframe(pd.DataFrame(hits)[["session_id", "role", "content", "language", "mode", "timestamp"]],
+                         use_container_width=True)
+        else:
+            st.caption("No messages match this search.")
+        backlog = cached(fts_backfill_status)()["pending"]
+        if backlog:
+            st.caption(f"{backlog} older messages are not indexed yet; "
+                       "run `python cli.py fts-backfill` to include them.")
+
     st.markdown("---")
 
     # ── Sessions table ─────────────────────────────────────────────────────────
     st.subheader("📋 Recent Sessions")
     import pandas as pd
+    sessions = _pager("dash_sessions", cached(get_sessions_page), page_size, **filters)
     df_sessions = pd.DataFrame(sessions)
     if not df_sessions.empty:
+        df_sessions = df_sessions[["session_id", "language", "mode", "created_at", "message_count"]]
         df_sessions.columns = ["Session ID", "Language", "Mode", "Created At", "Messages"]
         st.dataframe(df_sessions, use_container_width=True)
+    else:
+        st.caption("No sessions match these filters.")
 
     st.markdown("---")
 
     # ── Message log ────────────────────────────────────────────────────────────
-    st.subheader("📨 Recent Messages (last 50)")
-    df_msgs = pd.DataFrame(messages[:50])
+    st.subheader("📨 Recent Messages")
+    page_messages = _pager("dash_messages", cached(get_messages_page), page_size, **filters)
+    df_msgs = pd.DataFrame(page_messages)
     if not df_msgs.empty:
         st.dataframe(df_msgs[["session_id", "role", "content", "language", "mode", "timestamp"]],
                      use_container_width=True)
@@ -59,33 +225,58 @@ def render_dashboard():
 
     # ── Google Sheets sync ─────────────────────────────────────────────────────
     st.subheader("☁️ Google Sheets Sync")
+    outbox = cached(get_outbox_stats)()
+    o1, o2, o3 = st.columns(3)
+    o1.metric("📤 Outbox Pending", outbox["pending"])
+    o2.metric("⏳ Sync Lag", f"{outbox['lag_seconds']:.0f} s")
+    o3.metric("🔁 Retrying", outbox["retrying"])
+    if outbox["last_error"]:
+        st.caption(f"Last sync error: {outbox['last_error']}")
     if st.button("🔄 Sync All Conversations to Google Sheets"):
         from utils.sheets import sync_messages_to_sheet
         with st.spinner("Syncing..."):
-            result = sync_messages_to_sheet(messages)
+            result = sync_messages_to_sheet()
         if result["success"]:
             st.success(f"✅ Synced {result['synced']} new messages to Google Sheets!")
         else:
             st.error(f"❌ Failed: {result['error']}")
+            if "watermark" in result:
+                st.caption(f"{result['synced']} rows were synced before the error; "
+                           f"the next sync resumes after message #{result['watermark']}.")
             st.info("Make sure your `credentials.json` and `GOOGLE_SHEET_ID` are configured. See README.md.")
 
-    # ── DB download ────────────────────────────────────────────────────────────
+    # ── Export (utils/export: consistent snapshot, streamed to disk) ─────────────
     st.markdown("---")
     st.subheader("⬇️ Export Data")
-    if os.path.exists(DB_PATH):
-        with open(DB_PATH, "rb") as f:
-            st.download_button(
-                label="Download SQLite Database",
-                data=f,
-                file_name="conversations.db",
-                mime="application/octet-stream"
-            )
-    if messages:
-        import pandas as pd
-        csv = pd.DataFrame(messages).to_csv(index=False)
-        st.download_button(
-            label="Download as CSV",
-            data=csv,
-            file_name="conversations.csv",
-            mime="text/csv"
-        )
+    from utils.export import EXPORT_TABLES, export_database, export_table, open_snapshot, \
+        parquet_available, prune_exports
+    e1, e2 = st.columns(2)
+    tables = e1.multiselect("Tables", list(EXPORT_TABLES), default=["messages"])
+    formats = {"CSV (gzip)": "csv", "JSON Lines (gzip)": "jsonl", "SQLite database": "sqlite"}
+    if parquet_available():
+        formats["Parquet"] = "parquet"
+    export_format = formats[e2.selectbox("Format", list(formats))]
+    st.caption("Table exports use the From / To filters above. "
+               "For very large exports use `python cli.py export`.")
+    if st.button("📦 Prepare export", disabled=not tables and export_format != "sqlite"):
+        prune_exports()
+        with st.spinner("Exporting from a snapshot..."):
+            if export_format == "sqlite":
+                files = [(export_database(), None)]
+            else:
+                with open_snapshot() as snap:
+                    files = [export_table(snap, table, export_format, start=filters["start"], end=filters["end"])
+                             for table in tables]
+        # Offered only on this run: re-sending the files on every rerun would
+        # reload them into memory each time.
+        for path, rows in files:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            details = f"{size_mb:.1f} MB" + (f", {rows} rows" if rows is not None else "")
+            if size_mb > DASHBOARD_DOWNLOAD_MAX_MB:
+                st.warning(f"{os.path.basename(path)} ({details}) is too large to download here; "
+                           f"it was saved to `{path}`. Use `python cli.py export` on the server.")
+                continue
+            with open(path, "rb") as f:
+                st.download_button(f"Download {os.path.basename(path)} ({details})", data=f,
+                                   file_name=os.path.basename(path),
+                                   mime="application/octet-stream", key=f"dl_{path}")
@@ -3,12 +3,9 @@ pages/voice_page.py
 Voice support interface - record audio, transcribe, get AI reply, play back TTS.
 """
 import streamlit as st
-import io
-from utils.ai_engine import transcribe_audio, chat_with_gpt, text_to_speech, detect_language
-from utils.database import create_session, save_message, get_session_messages
-from utils.sheets import append_single_message
-from utils.database import get_connection
-from datetime import datetime
+from utils.ai_engine import audio_cache_key
+from utils.database import create_session, get_session_messages
+from utils.turns import voice_turn
 
 LABELS = {
     "en": {
@@ -20,7 +17,8 @@ LABELS = {
         "play_response": "🔊 Play Response",
         "thinking": "Processing your voice...",
         "no_audio": "Please upload an audio file.",
-        "history_title": "📜 Conversation History"
+        "history_title": "📜 Conversation History",
+        "already_processed": "This recording was already processed; showing the earlier answer."
     },
     "ar": {
         "title": "🎙️ دعم صوتي",
@@ -31,17 +29,27 @@ LABELS = {
         "play_response": "🔊 تشغيل الرد",
         "thinking": "جاري معالجة صوتك...",
         "no_audio": "يرجى رفع ملف صوتي.",
-        "history_title": "📜 سجل المحادثة"
+        "history_title": "📜 سجل المحادثة",
+        "already_processed": "تمت معالجة هذا التسجيل من قبل؛ يتم عرض الرد السابق."
     }
 }
 
-def get_last_message_id():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT MAX(id) FROM messages")
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] or 0
+def _audio_stats_caption(stats: dict) -> str:
+    if stats.get("cache_hit"):
+        return "🎧 Transcript served from cache (no Whisper call)"
+    if "processed_seconds" not in stats:   # preprocessing didn't run: sent as uploaded
+        return (f"🎧 Upload {stats.get('original_bytes', 0) / 1024:.0f} KB sent unprocessed "
+                f"({stats.get('skipped', 'not preprocessed')}), Whisper {stats.get('transcribe_ms', 0):.0f} ms")
+    sent, original = stats.get("processed_bytes", 0), stats.get("original_bytes", 0)
+    caption = f"🎧 Upload {original / 1024:.0f} KB → {sent / 1024:.0f} KB"
+    if original:
+        caption += f" (−{1 - sent / original:.0%})"
+    if "processed_seconds" in stats:
+        caption += f", {stats['original_seconds']:.1f}s → {stats['processed_seconds']:.1f}s audio"
+    caption += f", prep {stats.get('preprocess_ms', 0):.0f} ms, Whisper {stats.get('transcribe_ms', 0):.0f} ms"
+    if stats.get("chunks", 1) > 1:
+        caption += f" ({stats['chunks']} chunks in parallel)"
+    return caption
 
 def render_voice(language: str, session_id: str):
     lbl = LABELS[language]
@@ -79,44 +87,40 @@ def render_voice(language: str, session_id: str):
         if not audio_file:
             st.warning(lbl["no_audio"])
         else:
-            with st.spinner(lbl["thinking"]):
-                audio_bytes = audio_file.read()
-
-                # Step 1: Transcribe
-                user_text = transcribe_audio(audio_bytes, language)
-                detected_lang = detect_language(user_text)
-                active_lang = detected_lang
-
-                st.success(f"{lbl['transcribed']} **{user_text}**")
-
-                # Save user message
-                save_message(session_id, "user", user_text, active_lang, "voice")
-                st.session_state.voice_messages.append({"role": "user", "content": user_text})
-
-                # Step 2: GPT-4 reply
-                reply = chat_with_gpt(st.session_state.voice_messages, active_lang)
-                st.info(f"{lbl['ai_reply']} **{reply}**")
-
-                # Save assistant message
-                save_message(session_id, "assistant", reply, active_lang, "voice")
-                st.session_state.voice_messages.append({"role": "assistant", "content": reply})
-
-                # Real-time Google Sheets sync
-                msg_id = get_last_message_id()
-                append_single_message({
-                    "id": msg_id,
-                    "session_id": session_id,
-                    "role": "assistant",
-                    "content": reply,
-                    "language": active_lang,
-                    "mode": "voice",
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-
-                # Step 3: TTS
-                tts_audio = text_to_speech(reply, active_lang)
-                st.audio(tts_audio, format="audio/mp3")
-                st.caption(lbl["play_response"])
+            audio_bytes = audio_file.getvalue()
+            # Uploads already answered in this session (button pressed again,
+            # rerun) replay the earlier turn instead of saving it twice. A turn
+            # whose reply failed is retried without saving the question again.
+            processed = st.session_state.setdefault("voice_processed", {})
+            upload_key = (session_id, audio_cache_key(audio_bytes, language))
+            previous = processed.get(upload_key)
+            if previous and previous["reply"] is not None:
+                st.info(lbl["already_processed"])
+                st.success(f"{lbl['transcribed']} **{previous['user_text']}**")
+                if previous["reply"]:
+                    st.info(f"{lbl['ai_reply']} **{previous['reply']}**")
+            else:
+                with st.spinner(lbl["thinking"]):
+                    # Transcribe, save, stream the GPT-4 reply and voice it sentence by sentence
+                    turn, sentences = {}, []
+                    for kind, payload in voice_turn(session_id, st.session_state.voice_messages,
+                                                    audio_bytes, audio_file.name, language, turn,
+                                                    saved_user_text=previous["user_text"] if previous else None):
+                        if kind == "transcript":
+                            # The user message is saved now; remember it before the reply can fail
+                            processed[upload_key] = {"user_text": payload, "reply": None}
+                            st.success(f"{lbl['transcribed']} **{payload}**")
+                            if turn["audio_stats"]:
+                                st.caption(_audio_stats_caption(turn["audio_stats"]))
+                            reply_box = st.empty()
+                        else:
+                            sentence, tts_audio = payload
+                            sentences.append(sentence)
+                            reply_box.info(f"{lbl['ai_reply']} **{' '.join(sentences)}**")
+                            if tts_audio is not None:
+                                st.audio(tts_audio, format="audio/mp3")
+                    st.caption(lbl["play_response"])
+                    processed[upload_key]["reply"] = turn["reply"]
 
     # ── Conversation history ───────────────────────────────────────────────────
     st.markdown("---")
@@ -129,8 +133,7 @@ def render_voice(language: str, session_id: str):
     st.markdown("---")
     if st.button("📤 Sync to Google Sheets"):
         from utils.sheets import sync_messages_to_sheet
-        from utils.database import get_all_messages_flat
-        result = sync_messages_to_sheet(get_all_messages_flat())
+        result = sync_messages_to_sheet()
         if result["success"]:
             st.success(f"✅ Synced! ({result['synced']} new rows)")
         else:
@@ -1,16 +1,69 @@
 """
 utils/ai_engine.py
 OpenAI GPT-4 chat + Whisper voice transcription + gTTS voice response.
+The API calls themselves go through utils/llm_backend (pooled HTTP,
+deadlines, retries; LLM_BACKEND=fake for offline runs).
 """
+import hashlib
 import os
-import tempfile
-import openai
-from gtts import gTTS
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from utils.database import get_session_summary, save_session_summary
+from utils.cache import PersistentCache
+from utils.text import normalize_prompt, merge_transcripts, detect_language  # noqa: F401 (pages import it from here)
+from utils.tts_cache import TTSCache
+from utils.llm_backend import get_backend
+from utils import metrics
+from utils.audio import (
+    AUDIO_PREPROCESS, TARGET_RATE, prepare_speech, compact_upload, split_speech, encode_audio,
+)
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Model parameters
+CHAT_MODEL = os.getenv("LLM_CHAT_MODEL", "gpt-4o")
+CHAT_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+CHAT_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "500"))
+TRANSCRIBE_MODEL = os.getenv("LLM_TRANSCRIBE_MODEL", "whisper-1")
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # optional dependency; fall back to a character heuristic
+    _ENCODING = None
+
+# Prompt budget for system prompt + summary + recent history, in tokens.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# When over budget, trim history down to this fraction of the budget so the
+# summary is refreshed every few turns rather than on every turn.
+CONTEXT_LOW_WATER = float(os.getenv("CONTEXT_LOW_WATER", "0.6"))
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+
+# Cache of replies to repeated short questions ("reset password", ...).
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_CONTEXT = int(os.getenv("RESPONSE_CACHE_MAX_CONTEXT", "1"))  # messages
+response_cache = PersistentCache(
+    "response",
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+)
+
+tts_cache = TTSCache()
+
+# Transcripts keyed by audio hash + language: re-submitting the same upload
+# (Streamlit keeps it across reruns) costs no Whisper call.
+transcription_cache = PersistentCache(
+    "transcription",
+    max_entries=int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "500")),
+    ttl=float(os.getenv("TRANSCRIPTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600))),
+)
+
+# Long recordings are split at silence and transcribed in parallel
+# (chunk length: TRANSCRIBE_CHUNK_SECONDS in utils/audio.py).
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "4"))
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
+_transcribe_pool = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="whisper")
 
 # ─────────────────────────────────────────────
 # System prompts
@@ -45,75 +98,276 @@ Respond in English only.""",
 def get_system_prompt(language: str) -> str:
     return SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS["en"])
 
+# ─────────────────────────────────────────────
+# Context management (token budget + rolling summary)
+# ─────────────────────────────────────────────
+SUMMARY_PROMPTS = {
+    "en": "Summary of the earlier part of this conversation (for context only):\n",
+    "ar": "ملخص الجزء السابق من هذه المحادثة (للسياق فقط):\n",
+}
+
+def estimate_tokens(text: str) -> int:
+    """Token count via tiktoken when installed, otherwise a per-script heuristic."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return ascii_chars // 4 + (len(text) - ascii_chars) // 2 + 1
+
+def _message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + 4  # role / framing overhead
+
+def summarize_turns(previous_summary: str, turns: list, language: str = "en") -> str:
+    """Fold `turns` into the running summary with a small, cheap model."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+    instruction = (
+        "Update the running summary of a customer support conversation. Keep account "
+        "details, the customer's problem, steps already tried and any promises made. "
+        "Be brief (under 150 words). Write the summary in "
+        + ("Arabic." if language == "ar" else "English.")
+    )
+    with metrics.span("llm.summary", language=language):
+        return get_backend().chat(
+            [
+                {"role": "system", "content": instruction},
+                {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\n"
+                                            f"New turns:\n{transcript}"},
+            ],
+            model=CONTEXT_SUMMARY_MODEL,
+            temperature=0.2,
+            max_tokens=300
+        )
+
+def build_context(messages: list, language: str = "en", session_id: str = None,
+                  mode: str = "chat", budget: int = None) -> list:
+    """
+    Return the full prompt (system + optional summary + recent turns) within
+    the token budget.
+
+    Recent turns are kept verbatim. When the history outgrows the budget the
+    oldest turns are folded into a rolling summary stored per (session, mode),
+    so later turns only pay for the summary plus the recent window. Without a
+    session_id, older turns are simply dropped.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    system = {"role": "system", "content": get_system_prompt(language)}
+
+    summary, summarized = "", 0
+    if session_id:
+        summary, summarized = get_session_summary(session_id, mode)
+        if summarized > len(messages):  # history was reset; summary no longer applies
+            summary, summarized = "", 0
+
+    fixed = _message_tokens(system) + (estimate_tokens(summary) + 20 if summary else 0)
+    history = messages[summarized:]
+    history_tokens = [_message_tokens(m) for m in history]
+
+    if fixed + sum(history_tokens) > budget:
+        # Keep the newest turns up to the low-water mark (always at least the last one).
+        target = budget * CONTEXT_LOW_WATER - fixed
+        keep, used = 0, 0
+        for tokens in reversed(history_tokens):
+            if keep and used + tokens > target:
+                break
+            keep += 1
+            used += tokens
+        evicted, history = history[:len(history) - keep], history[len(history) - keep:]
+        if evicted and session_id:
+            summary = summarize_turns(summary, evicted, language)
+            summarized += len(evicted)
+            save_session_summary(session_id, mode, summary, summarized)
+
+    prompt = [system]
+    if summary:
+        prompt.append({"role": "system", "content": SUMMARY_PROMPTS.get(language, SUMMARY_PROMPTS["en"]) + summary})
+    return prompt + history
+
+# ─────────────────────────────────────────────
+# Response cache
+# ─────────────────────────────────────────────
+def response_cache_key(messages: list, language: str = "en"):
+    """
+    Cache key for single-turn / short-context requests, None otherwise.
+    Built from the language and every message in the (short) context, each
+    normalized so spelling variants of the same question share an entry.
+    """
+    if (not RESPONSE_CACHE_ENABLED or not messages
+            or len(messages) > RESPONSE_CACHE_MAX_CONTEXT or messages[-1]["role"] != "user"):
+        return None
+    return language + "|" + "|".join(f"{m['role']}:{normalize_prompt(m['content'])}" for m in messages)
+
+def get_response_cache_stats() -> dict:
+    return response_cache.stats()
+
 # ─────────────────────────────────────────────
 # Chat completion
 # ─────────────────────────────────────────────
-def chat_with_gpt(messages: list, language: str = "en") -> str:
+def chat_with_gpt(messages: list, language: str = "en", session_id: str = None,
+                  mode: str = "chat") -> str:
     """
     Send conversation history to GPT-4 and return assistant reply.
     
     messages: list of {"role": "user"/"assistant", "content": "..."}
+    session_id: enables the persisted rolling summary for long conversations
     """
-    system = {"role": "system", "content": get_system_prompt(language)}
-    full_messages = [system] + messages
+    cache_key = response_cache_key(messages, language)
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=full_messages,
-        temperature=0.7,
-        max_tokens=500
+    full_messages = build_context(messages, language, session_id, mode)
+
+    with metrics.span("llm.chat", session_id=session_id, language=language, mode=mode):
+        reply = get_backend().chat(
+            full_messages,
+            model=CHAT_MODEL,
+            temperature=CHAT_TEMPERATURE,
+            max_tokens=CHAT_MAX_TOKENS
+        )
+    if cache_key:
+        response_cache.put(cache_key, reply)
+    return reply
+
+def chat_with_gpt_stream(messages: list, language: str = "en", timings: dict = None,
+                         session_id: str = None, mode: str = "chat"):
+    """
+    Streaming variant of chat_with_gpt: yields text deltas as they arrive.
+
+    If a timings dict is passed it is filled in as the stream progresses with
+    ttft_ms (time to first token) and total_ms (full generation time), plus
+    cache_hit=True when the reply came from the response cache.
+    """
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+
+    cache_key = response_cache_key(messages, language)
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            timings["cache_hit"] = True
+            timings["ttft_ms"] = timings["total_ms"] = (time.perf_counter() - started) * 1000
+            yield cached
+            return
+
+    full_messages = build_context(messages, language, session_id, mode)
+    stream = get_backend().chat_stream(
+        full_messages,
+        model=CHAT_MODEL,
+        temperature=CHAT_TEMPERATURE,
+        max_tokens=CHAT_MAX_TOKENS
     )
-    return response.choices[0].message.content.strip()
+    parts = []
+    for delta in stream:
+        if "ttft_ms" not in timings:
+            timings["ttft_ms"] = (time.perf_counter() - started) * 1000
+        parts.append(delta)
+        yield delta
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    tags = {"session_id": session_id, "language": language, "mode": mode}
+    metrics.record("llm.ttft", timings.get("ttft_ms"), **tags)
+    metrics.record("llm.stream", timings["total_ms"], **tags)
+    if cache_key:
+        response_cache.put(cache_key, "".join(parts).strip())
 
 # ─────────────────────────────────────────────
 # Whisper: audio → text
 # ─────────────────────────────────────────────
-def transcribe_audio(audio_bytes: bytes, language: str = "en") -> str:
+def _whisper(audio_bytes: bytes, filename: str, lang_code: str) -> str:
+    with metrics.span("whisper", language=lang_code):
+        return get_backend().transcribe(audio_bytes, filename, lang_code, model=TRANSCRIBE_MODEL)
+
+def _whisper_chunk(samples, lang_code: str):
+    """Encode and transcribe one chunk; returns (text, bytes uploaded)."""
+    encoded, ext = encode_audio(samples, TARGET_RATE)
+    return _whisper(encoded, f"chunk.{ext}", lang_code), len(encoded)
+
+def audio_cache_key(audio_bytes: bytes, language: str = "en") -> str:
+    """Content hash of an upload plus the transcription language."""
+    lang_code = "ar" if language == "ar" else "en"
+    return f"{lang_code}:{hashlib.sha256(audio_bytes).hexdigest()}"
+
+def get_transcription_cache_stats() -> dict:
+    return transcription_cache.stats()
+
+def transcribe_audio(audio_bytes: bytes, language: str = "en", filename: str = "audio.wav",
+                     stats: dict = None) -> str:
     """
     Transcribe audio bytes using OpenAI Whisper.
     Returns transcribed text.
+
+    The upload is first downmixed, resampled to 16 kHz, silence-trimmed and
+    re-encoded (utils/audio, AUDIO_PREPROCESS=0 disables it). Recordings
+    longer than one chunk (TRANSCRIBE_CHUNK_SECONDS) are split at quiet points
+    and the chunks transcribed concurrently, so latency follows the chunk
+    length rather than the recording length; the pieces are stitched back in
+    order with boundary duplicates removed. Oversized uploads are always
+    chunked, as Whisper rejects files above 25 MB.
+
+    The bytes are wrapped in a named in-memory buffer (the name tells the API
+    the container format), so nothing is written to disk. If a stats dict is
+    passed it receives the preprocessing numbers, chunks and transcribe_ms.
+
+    Transcripts are cached by audio_cache_key; a hit returns immediately with
+    stats["cache_hit"] set.
     """
+    stats = stats if stats is not None else {}
     lang_code = "ar" if language == "ar" else "en"
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-        tmp.write(audio_bytes)
-        tmp_path = tmp.name
-
-    try:
-        with open(tmp_path, "rb") as audio_file:
-            transcript = openai.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language=lang_code
-            )
-        return transcript.text.strip()
-    finally:
-        os.unlink(tmp_path)
+    cache_key = audio_cache_key(audio_bytes, lang_code)
+    cached = transcription_cache.get(cache_key)
+    if cached is not None:
+        stats.update({"cache_hit": True, "original_bytes": len(audio_bytes), "processed_bytes": 0})
+        return cached
+    speech = None
+    if AUDIO_PREPROCESS or len(audio_bytes) > WHISPER_MAX_BYTES:
+        try:
+            with metrics.span("audio.preprocess"):
+                speech, prep = prepare_speech(audio_bytes, filename)
+            stats.update(prep)
+        except Exception as e:
+            stats["skipped"] = f"decode failed: {e}"
+
+    chunks = split_speech(speech) if speech is not None else []
+    started = time.perf_counter()
+    if len(chunks) > 1:
+        results = list(_transcribe_pool.map(metrics.bind(lambda c: _whisper_chunk(c, lang_code)), chunks))
+        text = merge_transcripts([t for t, _ in results])
+        stats["processed_bytes"] = sum(size for _, size in results)
+    else:
+        if speech is not None:
+            audio_bytes, filename = compact_upload(speech, audio_bytes, filename, stats)
+        else:
+            stats.setdefault("skipped", "preprocessing off")
+            stats["original_bytes"] = stats["processed_bytes"] = len(audio_bytes)
+        text = _whisper(audio_bytes, filename, lang_code)
+    stats["chunks"] = max(1, len(chunks))
+    stats["transcribe_ms"] = (time.perf_counter() - started) * 1000
+    transcription_cache.put(cache_key, text)
+    return text
 
 # ─────────────────────────────────────────────
 # gTTS: text → audio bytes
 # ─────────────────────────────────────────────
+def _synthesize(text: str, language: str = "en") -> bytes:
+    lang_code = "ar" if language == "ar" else "en"
+    with metrics.span("tts", language=lang_code):
+        return get_backend().synthesize(text, lang_code)
+
 def text_to_speech(text: str, language: str = "en") -> bytes:
     """
     Convert text to speech using gTTS.
-    Returns audio bytes (MP3).
+    Returns audio bytes (MP3). Repeated (language, text) pairs are served
+    from the on-disk TTS cache.
     """
     lang_code = "ar" if language == "ar" else "en"
-    tts = gTTS(text=text, lang=lang_code, slow=False)
-    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
-        tts.save(tmp.name)
-        tmp_path = tmp.name
-
-    try:
-        with open(tmp_path, "rb") as f:
-            audio_bytes = f.read()
-        return audio_bytes
-    finally:
-        os.unlink(tmp_path)
+    audio_bytes = tts_cache.get(lang_code, text)
+    if audio_bytes is None:
+        audio_bytes = _synthesize(text, lang_code)
+        tts_cache.put(lang_code, text, audio_bytes)
+    return audio_bytes
 
-# ─────────────────────────────────────────────
-# Language detection (simple heuristic)
-# ─────────────────────────────────────────────
-def detect_language(text: str) -> str:
-    """Simple Arabic character detection."""
-    arabic_chars = sum(1 for c in text if '\u0600' <= c <= '\u06FF')
-    return "ar" if arabic_chars > len(text) * 0.2 else "en"
+def prewarm_tts_cache(phrases: dict = None) -> int:
+    """Synthesize the common phrases (both languages) into the TTS cache."""
+    return tts_cache.prewarm(_synthesize, phrases)
+
+def get_tts_cache_stats() -> dict:
+    return tts_cache.stats()
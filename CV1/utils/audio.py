@@ -0,0 +1,229 @@
+"""
+utils/audio.py
+Audio preprocessing before Whisper: decode → mono → 16 kHz → trim leading /
+trailing silence → compact re-encode (16-bit FLAC by default).
+
+Phone recordings are often 48 kHz stereo WAV or long M4A files; Whisper works
+at 16 kHz mono internally, so everything above that is upload time we pay for
+nothing. If the input cannot be decoded (missing ffmpeg, odd codec) or the
+result would not be smaller, the original bytes are sent unchanged.
+
+Long recordings are split at quiet points into overlapping chunks
+(split_speech) so they can be transcribed in parallel and stay under the
+Whisper upload limit.
+"""
+import io
+import os
+import subprocess
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+
+TARGET_RATE = 16000
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "1") == "1"
+# "flac" (lossless, default) or "ogg" (Opus, much smaller; needs libsndfile >= 1.0.29)
+OUTPUT_FORMAT = os.getenv("AUDIO_PREPROCESS_FORMAT", "flac").lower()
+SILENCE_THRESHOLD_DB = float(os.getenv("AUDIO_SILENCE_THRESHOLD_DB", "-45"))  # dBFS
+SILENCE_PAD_MS = 200
+FRAME_MS = 20
+FFMPEG = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFMPEG_TIMEOUT_SECONDS = float(os.getenv("FFMPEG_TIMEOUT_SECONDS", "120"))
+# MP4-family files whose index (moov atom) comes last can't be read from a pipe
+_SEEKING_CONTAINERS = {"m4a", "mp4", "mov", "3gp"}
+
+# Long-audio chunking (see split_speech / ai_engine.transcribe_audio).
+CHUNK_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "60"))
+CHUNK_SEARCH_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_SEARCH_SECONDS", "10"))
+CHUNK_OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_OVERLAP_SECONDS", "1"))
+
+
+def decode_audio(audio_bytes: bytes, filename: str = "audio.wav"):
+    """
+    Return (samples float32 shaped [frames, channels], sample_rate).
+    Input libsndfile can't read is decoded by ffmpeg over pipes, already
+    downmixed to mono TARGET_RATE.
+    """
+    try:
+        samples, rate = sf.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=True)
+        return samples, rate
+    except Exception:
+        pass
+    # Compressed containers libsndfile can't read (m4a, mp3 on old builds) go through ffmpeg.
+    try:
+        return _ffmpeg_decode(audio_bytes, "pipe:0")
+    except RuntimeError:
+        ext = os.path.splitext(filename)[1].lstrip(".").lower()
+        if ext not in _SEEKING_CONTAINERS:
+            raise
+    # The one case that needs a real file: ffmpeg has to seek to the MP4 index.
+    fd, path = tempfile.mkstemp(suffix="." + ext)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio_bytes)
+        return _ffmpeg_decode(None, path)
+    finally:
+        os.remove(path)
+
+
+def _ffmpeg_decode(audio_bytes, source: str):
+    """
+    Decode with ffmpeg straight to mono TARGET_RATE 16-bit PCM on stdout.
+    source is "pipe:0" (audio_bytes fed on stdin) or a file path.
+    """
+    command = [FFMPEG, "-hide_banner", "-loglevel", "error", "-i", source,
+               "-f", "s16le", "-ac", "1", "-ar", str(TARGET_RATE), "pipe:1"]
+    feed = {"input": audio_bytes} if audio_bytes is not None else {"stdin": subprocess.DEVNULL}
+    result = subprocess.run(command, capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS, **feed)
+    if result.returncode != 0 or not result.stdout:
+        error = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(f"ffmpeg could not decode the audio: {error[-1] if error else 'no output'}")
+    samples = np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768.0
+    return samples.reshape(-1, 1), TARGET_RATE
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int = TARGET_RATE) -> np.ndarray:
+    """
+    Linear-interpolation resampler with a moving-average anti-alias filter
+    when downsampling. Plenty for speech recognition and cheap on long input.
+    """
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples.astype(np.float32, copy=False)
+    ratio = src_rate / dst_rate
+    if ratio > 1:
+        width = int(round(ratio))
+        if width > 1:
+            samples = np.convolve(samples, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    n_out = int(len(samples) / ratio)
+    positions = np.arange(n_out, dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def frame_levels_db(samples: np.ndarray, rate: int, frame_ms: int = FRAME_MS) -> np.ndarray:
+    """RMS level of consecutive frames in dBFS."""
+    frame = max(1, int(rate * frame_ms / 1000))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def trim_silence(samples: np.ndarray, rate: int, threshold_db: float = SILENCE_THRESHOLD_DB,
+                 pad_ms: int = SILENCE_PAD_MS) -> np.ndarray:
+    """Cut leading and trailing frames quieter than threshold_db (keeping pad_ms of margin)."""
+    levels = frame_levels_db(samples, rate)
+    voiced = np.nonzero(levels > threshold_db)[0]
+    if len(voiced) == 0:
+        return samples
+    frame = int(rate * FRAME_MS / 1000)
+    pad = int(rate * pad_ms / 1000)
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def encode_audio(samples: np.ndarray, rate: int = TARGET_RATE, fmt: str = OUTPUT_FORMAT):
+    """Encode mono float samples; returns (bytes, file extension)."""
+    buffer = io.BytesIO()
+    if fmt == "ogg":
+        sf.write(buffer, samples, rate, format="OGG", subtype="OPUS")
+        return buffer.getvalue(), "ogg"
+    sf.write(buffer, samples, rate, format="FLAC", subtype="PCM_16")
+    return buffer.getvalue(), "flac"
+
+
+def load_speech(audio_bytes: bytes, filename: str = "audio.wav"):
+    """Decode to mono 16 kHz float32 samples."""
+    samples, rate = decode_audio(audio_bytes, filename)
+    return resample(to_mono(samples), rate, TARGET_RATE), TARGET_RATE
+
+
+def prepare_speech(audio_bytes: bytes, filename: str = "audio.wav"):
+    """
+    Decode, downmix, resample and silence-trim an upload.
+    Returns (samples at TARGET_RATE, stats). Raises if the input can't be decoded.
+    """
+    started = time.perf_counter()
+    samples, rate = decode_audio(audio_bytes, filename)
+    speech = trim_silence(resample(to_mono(samples), rate, TARGET_RATE), TARGET_RATE)
+    stats = {
+        "original_bytes": len(audio_bytes),
+        "original_seconds": len(samples) / rate,
+        "processed_seconds": len(speech) / TARGET_RATE,
+        "preprocess_ms": (time.perf_counter() - started) * 1000,
+    }
+    return speech, stats
+
+
+def compact_upload(speech: np.ndarray, audio_bytes: bytes, filename: str, stats: dict):
+    """
+    Re-encode prepared speech for upload, keeping the original bytes when
+    they are already smaller. Returns (bytes, filename) and updates stats.
+    """
+    started = time.perf_counter()
+    encoded, ext = encode_audio(speech, TARGET_RATE)
+    stats["preprocess_ms"] = stats.get("preprocess_ms", 0) + (time.perf_counter() - started) * 1000
+    if len(encoded) >= len(audio_bytes):
+        stats["processed_bytes"] = len(audio_bytes)
+        stats["skipped"] = "already compact"
+        return audio_bytes, filename
+    stats["processed_bytes"] = len(encoded)
+    name = os.path.splitext(os.path.basename(filename))[0] or "audio"
+    return encoded, f"{name}.{ext}"
+
+
+def preprocess_audio(audio_bytes: bytes, filename: str = "audio.wav"):
+    """
+    Shrink an upload before transcription.
+    Returns (bytes, filename, stats); stats has original/processed bytes and
+    seconds, the time spent, and `skipped` with a reason when the original
+    bytes were kept.
+    """
+    started = time.perf_counter()
+    try:
+        speech, stats = prepare_speech(audio_bytes, filename)
+        audio_bytes, filename = compact_upload(speech, audio_bytes, filename, stats)
+    except Exception as e:
+        return audio_bytes, filename, {
+            "original_bytes": len(audio_bytes),
+            "processed_bytes": len(audio_bytes),
+            "skipped": f"decode/encode failed: {e}",
+            "preprocess_ms": (time.perf_counter() - started) * 1000,
+        }
+    return audio_bytes, filename, stats
+
+
+def split_speech(samples: np.ndarray, rate: int = TARGET_RATE, chunk_seconds: float = CHUNK_SECONDS,
+                 search_seconds: float = CHUNK_SEARCH_SECONDS,
+                 overlap_seconds: float = CHUNK_OVERLAP_SECONDS) -> list:
+    """
+    Split long speech into chunks of at most ~chunk_seconds.
+
+    Each cut is placed at the quietest frame in the last search_seconds before
+    the nominal boundary, so words are rarely split. Every chunk after the
+    first starts overlap_seconds before its cut; the duplicated words this
+    produces are removed when the transcripts are stitched
+    (utils/text.merge_transcripts).
+    """
+    chunk = int(chunk_seconds * rate)
+    if len(samples) <= chunk:
+        return [samples]
+    search = int(min(search_seconds, chunk_seconds / 2) * rate)
+    overlap = int(overlap_seconds * rate)
+    frame = max(1, int(rate * FRAME_MS / 1000))
+
+    chunks, start = [], 0
+    while len(samples) - start > chunk:
+        window_start = start + chunk - search
+        levels = frame_levels_db(samples[window_start:start + chunk], rate)
+        cut = window_start + int(np.argmin(levels)) * frame + frame // 2 if len(levels) else start + chunk
+        chunks.append(samples[max(0, start - overlap):cut])
+        start = cut
+    chunks.append(samples[max(0, start - overlap):])
+    return chunks
@@ -0,0 +1,87 @@
+"""
+utils/cache.py
+Two-tier LRU + TTL cache: an in-process OrderedDict in front of the SQLite
+cache_entries table, so entries survive restarts and are shared between
+processes using the same database.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from utils.database import cache_get, cache_put, cache_evict, cache_clear
+
+
+class PersistentCache:
+    """
+    namespace: separates unrelated caches sharing the cache_entries table.
+    max_entries: LRU capacity of both tiers.
+    ttl: seconds an entry stays valid after it is written.
+    Values must be JSON-serializable.
+    """
+
+    EVICT_EVERY = 100  # puts between persistent-tier eviction sweeps
+
+    def __init__(self, namespace: str, max_entries: int = 1000, ttl: float = 86400.0):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+        stored = cache_get(self.namespace, key)
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return default
+            value = json.loads(stored[0])
+            self._remember(key, value, stored[1])
+            self.disk_hits += 1
+            return value
+
+    def put(self, key: str, value):
+        cache_put(self.namespace, key, json.dumps(value, ensure_ascii=False), self.ttl)
+        with self._lock:
+            self._remember(key, value, time.time() + self.ttl)
+            self._puts += 1
+            sweep = self._puts % self.EVICT_EVERY == 0
+        if sweep:
+            cache_evict(self.namespace, self.max_entries)
+
+    def clear(self):
+        cache_clear(self.namespace)
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -1,120 +1,1235 @@
 """
 utils/database.py
 SQLite database manager for storing OTT support conversations.
+
+Connections are pooled and reused for the life of the process. Each pooled
+connection is opened once with the tuned pragmas below and keeps its own
+prepared-statement cache, so helpers only pay for the query itself.
+
+Message inserts can optionally go through a write-behind queue
+(DB_WRITE_BEHIND=1): a background writer group-commits them in batches and
+every enqueue returns a Future resolving to the new row id.
 """
 import sqlite3
 import os
+import queue
+import threading
+import time
+import atexit
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
+from utils.text import ARABIC_DIACRITICS, TATWEEL, ARABIC_LETTER_FOLDS, normalize_prompt
+from utils import metrics
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "conversations.db")
 
-def get_connection():
+# Idle connections kept around for reuse; extra ones are opened on demand
+# and closed when they are handed back to a full pool.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Write-behind (group commit) for message inserts. Off by default.
+WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("DB_WRITE_BEHIND_BATCH_SIZE", "64"))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("DB_WRITE_BEHIND_FLUSH_MS", "50"))
+
+# Per-connection pragmas, applied once when a connection is opened.
+# journal_mode=WAL is persistent in the file but is re-asserted here so a
+# freshly created database picks it up on its very first connection.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size = -16000",     # ~16 MB page cache
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 134217728",   # 128 MB
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool."""
+
+    def close(self):
+        _release(self)
+
+    def _close(self):
+        sqlite3.Connection.close(self)
+
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_pool_path = None
+_pool_lock = threading.Lock()
+
+
+def _open_connection():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        isolation_level=None,              # explicit transactions only
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=PooledConnection,
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
-    """Create tables if they don't exist."""
+
+def _release(conn):
+    if conn.in_transaction:
+        conn.execute("ROLLBACK")
+    # Connections opened against a previous DB_PATH are not reused.
+    if _pool_path != DB_PATH:
+        conn._close()
+        return
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn._close()
+
+
+def get_connection():
+    """
+    Borrow a connection from the pool.
+    Calling close() on it returns it to the pool instead of closing it.
+    """
+    global _pool_path
+    if _pool_path != DB_PATH:
+        close_all_connections()
+        with _pool_lock:
+            _pool_path = DB_PATH
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _open_connection()
+
+
+def close_all_connections():
+    """Really close every idle pooled connection (shutdown / DB_PATH change)."""
+    while True:
+        try:
+            _pool.get_nowait()._close()
+        except queue.Empty:
+            return
+
+
+atexit.register(close_all_connections)
+
+
+@contextmanager
+def connection():
+    """Context manager around get_connection() that always releases."""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.executescript("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id  TEXT UNIQUE NOT NULL,
-            language    TEXT DEFAULT 'en',
-            mode        TEXT DEFAULT 'chat',
-            created_at  TEXT DEFAULT (datetime('now'))
-        );
-
-        CREATE TABLE IF NOT EXISTS messages (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id  TEXT NOT NULL,
-            role        TEXT NOT NULL,         -- 'user' or 'assistant'
-            content     TEXT NOT NULL,
-            language    TEXT DEFAULT 'en',
-            mode        TEXT DEFAULT 'chat',   -- 'chat' or 'voice'
-            timestamp   TEXT DEFAULT (datetime('now')),
-            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS feedback (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id  TEXT NOT NULL,
-            rating      INTEGER,               -- 1-5
-            comment     TEXT,
-            timestamp   TEXT DEFAULT (datetime('now'))
-        );
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+# Time spent waiting for the write lock (BEGIN IMMEDIATE), for load tests.
+_lock_waits = {"transactions": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+_lock_waits_lock = threading.Lock()
+
+# Bumped by every committed write transaction that changed rows, except
+# bookkeeping writes (metrics, cache entries, sync state) that opt out; the
+# dashboard keys its query cache on it (pages/dashboard_page.py).
+_write_generation = 0
+_write_generation_lock = threading.Lock()
+
+
+@contextmanager
+def write_transaction(stage: str = "sqlite.write", bump_generation: bool = True):
+    """
+    Run the block inside BEGIN IMMEDIATE ... COMMIT on a pooled connection.
+    Taking the write lock up front avoids SQLITE_BUSY on lock upgrades in WAL mode.
+    The whole transaction, lock wait included, is timed as a metrics span
+    (stage=None skips it). bump_generation=False keeps writes that no
+    dashboard query reads from invalidating the dashboard cache.
+    """
+    global _write_generation
+    with connection() as conn, metrics.span(stage):
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        waited = time.perf_counter() - started
+        with _lock_waits_lock:
+            _lock_waits["transactions"] += 1
+            _lock_waits["wait_seconds"] += waited
+            _lock_waits["max_wait_seconds"] = max(_lock_waits["max_wait_seconds"], waited)
+        changes = conn.total_changes
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if bump_generation and conn.total_changes != changes:
+            with _write_generation_lock:
+                _write_generation += 1
+
+
+def get_write_generation() -> int:
+    """
+    Changes whenever this process commits a write. Writes made by other
+    processes (cli.py) are not seen, so caches keyed on it also need a TTL.
+    """
+    return _write_generation
+
+
+def get_lock_wait_stats(reset: bool = False) -> dict:
+    """Write transactions started and the time they spent waiting for the lock."""
+    with _lock_waits_lock:
+        stats = dict(_lock_waits)
+        if reset:
+            _lock_waits.update(transactions=0, wait_seconds=0.0, max_wait_seconds=0.0)
+    return stats
+
+
+def checkpoint():
+    """Fold the WAL back into the main database file (e.g. before copying it)."""
+    with connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+_initialized = set()   # DB_PATHs already set up by this process
+_init_lock = threading.Lock()
+
+
+def init_db():
+    """
+    Create tables if they don't exist. app.py calls this on every rerun, so
+    after the first call for a database it returns without touching it.
+    """
+    with _init_lock:
+        if DB_PATH in _initialized:
+            return
+        _init_db()
+        _initialized.add(DB_PATH)
+
+
+def _init_db():
+    with connection() as conn:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id  TEXT UNIQUE NOT NULL,
+                language    TEXT DEFAULT 'en',
+                mode        TEXT DEFAULT 'chat',
+                created_at  TEXT DEFAULT (datetime('now'))
+            );
+
+            CREATE TABLE IF NOT EXISTS messages (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id  TEXT NOT NULL,
+                role        TEXT NOT NULL,         -- 'user' or 'assistant'
+                content     TEXT NOT NULL,
+                language    TEXT DEFAULT 'en',
+                mode        TEXT DEFAULT 'chat',   -- 'chat' or 'voice'
+                timestamp   TEXT DEFAULT (datetime('now')),
+                FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS feedback (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id  TEXT NOT NULL,
+                rating      INTEGER,               -- 1-5
+                comment     TEXT,
+                timestamp   TEXT DEFAULT (datetime('now'))
+            );
+
+            -- Perceived-latency numbers for each assistant reply.
+            CREATE TABLE IF NOT EXISTS turn_timings (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id  TEXT NOT NULL,
+                message_id  INTEGER,               -- assistant message
+                mode        TEXT DEFAULT 'chat',
+                ttft_ms     REAL,                  -- time to first token
+                total_ms    REAL,                  -- full generation time
+                timestamp   TEXT DEFAULT (datetime('now'))
+            );
+
+            -- Rolling summary of the older part of a conversation, used to keep
+            -- the LLM prompt within its token budget (utils/ai_engine.build_context).
+            CREATE TABLE IF NOT EXISTS session_summaries (
+                session_id        TEXT NOT NULL,
+                mode              TEXT NOT NULL DEFAULT 'chat',
+                summary           TEXT NOT NULL,
+                summarized_count  INTEGER NOT NULL,   -- leading messages folded in
+                updated_at        TEXT DEFAULT (datetime('now')),
+                PRIMARY KEY (session_id, mode)
+            );
+
+            -- Persistent tier of utils/cache.PersistentCache (LRU + TTL).
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace     TEXT NOT NULL,
+                key           TEXT NOT NULL,
+                value         TEXT NOT NULL,
+                expires_at    REAL NOT NULL,     -- unix time
+                last_used_at  REAL NOT NULL,
+                hits          INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_cache_entries_lru
+                ON cache_entries(namespace, last_used_at);
+
+            -- Small persisted key/value state (sync watermarks, backfill progress).
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key         TEXT PRIMARY KEY,
+                value       TEXT,
+                updated_at  TEXT DEFAULT (datetime('now'))
+            ) WITHOUT ROWID;
+
+            -- Messages waiting to be appended to Google Sheets by the
+            -- background worker (utils/sheets.py). Keyed by message id so a
+            -- message is never enqueued twice.
+            CREATE TABLE IF NOT EXISTS sheets_outbox (
+                message_id      INTEGER PRIMARY KEY,
+                attempts        INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,   -- unix time
+                enqueued_at     REAL NOT NULL,
+                delivered_at    REAL,
+                last_error      TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_sheets_outbox_pending
+                ON sheets_outbox(next_attempt_at) WHERE delivered_at IS NULL;
+
+            -- Voicemail files already ingested by `cli.py ingest`, keyed by
+            -- content hash; written in the same transaction as their messages,
+            -- so it doubles as the resume checkpoint.
+            CREATE TABLE IF NOT EXISTS ingested_files (
+                file_hash    TEXT PRIMARY KEY,
+                path         TEXT NOT NULL,
+                session_id   TEXT NOT NULL,
+                ingested_at  TEXT DEFAULT (datetime('now'))
+            ) WITHOUT ROWID;
+
+            -- Per-stage latency spans (utils/metrics.py), written in batches.
+            CREATE TABLE IF NOT EXISTS metrics (
+                id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                stage        TEXT NOT NULL,     -- 'whisper', 'llm.ttft', 'tts', 'sqlite.write', ...
+                duration_ms  REAL NOT NULL,
+                ok           INTEGER NOT NULL DEFAULT 1,
+                session_id   TEXT,
+                language     TEXT,
+                mode         TEXT,
+                recorded_at  REAL NOT NULL      -- unix time
+            );
+            CREATE INDEX IF NOT EXISTS idx_metrics_recorded_at ON metrics(recorded_at);
+
+            CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions(created_at);
+            CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+
+            -- Running totals for the dashboard KPIs, kept current by triggers.
+            -- Names: 'sessions', 'messages', 'messages.language.<xx>',
+            --        'messages.mode.<mode>', 'messages.role.<role>', ...
+            CREATE TABLE IF NOT EXISTS counters (
+                name        TEXT PRIMARY KEY,
+                value       INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+
+            CREATE TRIGGER IF NOT EXISTS trg_sessions_count_insert
+            AFTER INSERT ON sessions
+            BEGIN
+                INSERT INTO counters (name, value) VALUES
+                    ('sessions', 1),
+                    ('sessions.language.' || IFNULL(NEW.language, ''), 1),
+                    ('sessions.mode.' || IFNULL(NEW.mode, ''), 1)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_messages_count_insert
+            AFTER INSERT ON messages
+            BEGIN
+                INSERT INTO counters (name, value) VALUES
+                    ('messages', 1),
+                    ('messages.language.' || IFNULL(NEW.language, ''), 1),
+                    ('messages.mode.' || IFNULL(NEW.mode, ''), 1),
+                    ('messages.role.' || NEW.role, 1)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_messages_count_delete
+            AFTER DELETE ON messages
+            BEGIN
+                INSERT INTO counters (name, value) VALUES
+                    ('messages', -1),
+                    ('messages.language.' || IFNULL(OLD.language, ''), -1),
+                    ('messages.mode.' || IFNULL(OLD.mode, ''), -1),
+                    ('messages.role.' || OLD.role, -1)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_messages_count_update
+            AFTER UPDATE OF role, language, mode ON messages
+            BEGIN
+                INSERT INTO counters (name, value) VALUES
+                    ('messages.language.' || IFNULL(OLD.language, ''), -1),
+                    ('messages.mode.' || IFNULL(OLD.mode, ''), -1),
+                    ('messages.role.' || OLD.role, -1)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+                INSERT INTO counters (name, value) VALUES
+                    ('messages.language.' || IFNULL(NEW.language, ''), 1),
+                    ('messages.mode.' || IFNULL(NEW.mode, ''), 1),
+                    ('messages.role.' || NEW.role, 1)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+            END;
+        """)
+
+    # Databases created before the counters table / search index existed
+    # need a one-off backfill; only then is the write lock taken.
+    with connection() as conn:
+        needs_counters = conn.execute("SELECT 1 FROM counters LIMIT 1").fetchone() is None
+        needs_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is None
+    if needs_counters or needs_fts:
+        with write_transaction() as conn:
+            if conn.execute("SELECT 1 FROM counters LIMIT 1").fetchone() is None:
+                _rebuild_counters(conn)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is None:
+                _create_fts(conn)
+
+    # Index a bounded slice of pre-existing messages per startup until done.
+    if FTS_STARTUP_BACKFILL_ROWS and fts_backfill_status()["pending"]:
+        backfill_fts(batch_size=FTS_STARTUP_BACKFILL_ROWS, max_batches=1)
+
+# ─────────────────────────────────────────────
+# Full-text search (FTS5)
+# ─────────────────────────────────────────────
+FTS_STARTUP_BACKFILL_ROWS = int(os.getenv("FTS_STARTUP_BACKFILL_ROWS", "2000"))
+# BM25 ranking is applied to the most recent matches only, which keeps very
+# common terms fast at millions of messages (rare terms are ranked in full).
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "1000"))
+
+def _fold_sql(expr: str, group: int = 12) -> str:
+    """
+    The Arabic folding of utils/text.normalize_arabic as REPLACE() calls, so
+    the index triggers need no Python function and work from any SQLite
+    client. The ~90 replacements are chained through scalar subqueries in
+    groups, as one nested expression that deep overflows SQLite's parser.
+    (NFKC is the one step left to the query side.)
+    """
+    pairs = [(c, "") for c in ARABIC_DIACRITICS + TATWEEL]
+    pairs += list(ARABIC_LETTER_FOLDS.items())
+    pairs += [(chr(base + i), str(i)) for base in (0x0660, 0x06F0) for i in range(10)]
+    query = None
+    for i in range(0, len(pairs), group):
+        inner = "x" if query else expr
+        for src, dst in pairs[i:i + group]:
+            inner = f"REPLACE({inner}, '{src}', '{dst}')"
+        query = f"SELECT {inner} AS x" + (f" FROM ({query})" if query else "")
+    return f"({query})"
+
+# Rows with backfill_after < id <= backfill_until existed before the index
+# and are not indexed yet; triggers must not 'delete' them from the index.
+_FTS_INDEXED = """(
+    {row}.id > IFNULL((SELECT CAST(value AS INTEGER) FROM sync_state WHERE key = 'fts.backfill_until'), 0)
+    OR {row}.id <= IFNULL((SELECT CAST(value AS INTEGER) FROM sync_state WHERE key = 'fts.backfill_after'), 0)
+)"""
+
+def _create_fts(conn):
+    """
+    Contentless FTS5 index over folded messages.content, maintained by
+    triggers. Existing rows are queued for backfill_fts.
+    """
+    conn.execute("""
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            content, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+        )
     """)
-    conn.commit()
-    conn.close()
+    conn.execute(f"""
+        CREATE TRIGGER trg_messages_fts_insert AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, {_fold_sql('NEW.content')});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_messages_fts_delete AFTER DELETE ON messages
+        WHEN {_FTS_INDEXED.format(row='OLD')}
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', OLD.id, {_fold_sql('OLD.content')});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_messages_fts_update AFTER UPDATE OF content ON messages
+        WHEN {_FTS_INDEXED.format(row='OLD')}
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', OLD.id, {_fold_sql('OLD.content')});
+            INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, {_fold_sql('NEW.content')});
+        END
+    """)
+    until = conn.execute("SELECT IFNULL(MAX(id), 0) FROM messages").fetchone()[0]
+    _set_sync_state(conn, "fts.backfill_after", 0)
+    _set_sync_state(conn, "fts.backfill_until", until)
+
+def fts_backfill_status() -> dict:
+    """{'indexed_upto', 'until', 'pending'} for the pre-existing-rows backfill."""
+    with connection() as conn:
+        after = int(conn.execute(
+            "SELECT IFNULL((SELECT value FROM sync_state WHERE key = 'fts.backfill_after'), 0)").fetchone()[0])
+        until = int(conn.execute(
+            "SELECT IFNULL((SELECT value FROM sync_state WHERE key = 'fts.backfill_until'), 0)").fetchone()[0])
+        pending = conn.execute("SELECT COUNT(*) FROM messages WHERE id > ? AND id <= ?",
+                               (after, until)).fetchone()[0]
+    return {"indexed_upto": after, "until": until, "pending": pending}
+
+def backfill_fts(batch_size: int = 5000, max_batches: int = None) -> int:
+    """
+    Index pre-existing messages in id order, one transaction per batch, and
+    record progress so it can be interrupted and resumed. Returns rows indexed.
+    """
+    indexed, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        with write_transaction() as conn:
+            after = int(conn.execute(
+                "SELECT IFNULL((SELECT value FROM sync_state WHERE key = 'fts.backfill_after'), 0)").fetchone()[0])
+            until = int(conn.execute(
+                "SELECT IFNULL((SELECT value FROM sync_state WHERE key = 'fts.backfill_until'), 0)").fetchone()[0])
+            if after >= until:
+                break
+            last = conn.execute("""
+                SELECT MAX(id) FROM (SELECT id FROM messages WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)
+            """, (after, until, batch_size)).fetchone()[0] or until
+            cursor = conn.execute(f"""
+                INSERT INTO messages_fts (rowid, content)
+                SELECT id, {_fold_sql('content')} FROM messages WHERE id > ? AND id <= ?
+            """, (after, last))
+            _set_sync_state(conn, "fts.backfill_after", last)
+        indexed += cursor.rowcount
+        batches += 1
+    return indexed
+
+def _fts_query(text: str) -> str:
+    """User input → FTS5 query: folded terms, all required, last one as a prefix."""
+    terms = [t.replace('"', '""') for t in normalize_prompt(text).split()]
+    if not terms:
+        return ""
+    return " ".join(f'"{t}"' for t in terms) + "*"
+
+def search_messages(query: str, limit: int = 20, cursor: int = None, session_id: str = None,
+                    role: str = None, language: str = None, mode: str = None,
+                    start: str = None, end: str = None):
+    """
+    Full-text search over message content, best matches (BM25) first among
+    the SEARCH_CANDIDATES most recent matching messages.
+    Same filters and (rows, next_cursor) contract as get_messages_page; the
+    cursor is the offset of the next page. Each row carries its score.
+    """
+    match = _fts_query(query)
+    if not match:
+        return [], None
+    clauses, params = _filters("m", "timestamp", language, mode, start, end,
+                               session_id=session_id, role=role)
+    where = "".join(" AND " + c for c in clauses)
+    offset = cursor or 0
+    with connection() as conn:
+        rows = conn.execute(f"""
+            SELECT * FROM (
+                SELECT m.id, m.session_id, m.role, m.content, m.language, m.mode, m.timestamp,
+                       f.rank AS score
+                FROM messages_fts f
+                JOIN messages m ON m.id = f.rowid
+                WHERE f.messages_fts MATCH ?{where}
+                ORDER BY f.rowid DESC
+                LIMIT ?
+            )
+            ORDER BY score, id DESC
+            LIMIT ? OFFSET ?
+        """, (match, *params, SEARCH_CANDIDATES, limit + 1, offset)).fetchall()
+    rows = [dict(r) for r in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = offset + limit
+    return rows, next_cursor
+
+def _rebuild_counters(conn):
+    conn.execute("DELETE FROM counters")
+    conn.execute("INSERT INTO counters (name, value) SELECT 'sessions', COUNT(*) FROM sessions")
+    conn.execute("INSERT INTO counters (name, value) SELECT 'messages', COUNT(*) FROM messages")
+    for table, column in (("sessions", "language"), ("sessions", "mode"),
+                          ("messages", "language"), ("messages", "mode"), ("messages", "role")):
+        conn.execute(f"""
+            INSERT INTO counters (name, value)
+            SELECT '{table}.{column}.' || IFNULL({column}, ''), COUNT(*)
+            FROM {table} GROUP BY 1
+        """)
+
+def rebuild_counters():
+    """Recompute every counter from the base tables (repair tool)."""
+    with write_transaction() as conn:
+        _rebuild_counters(conn)
+
+def get_counters(prefix: str = "") -> dict:
+    """Return {name: value} for all counters whose name starts with prefix."""
+    with connection() as conn:
+        rows = conn.execute("SELECT name, value FROM counters").fetchall()
+    return {r["name"]: r["value"] for r in rows if r["name"].startswith(prefix)}
+
+def get_message_stats() -> dict:
+    """
+    Dashboard KPIs straight from the counters table (constant time).
+    Returns totals plus per-language / per-mode / per-role breakdowns.
+    """
+    counters = get_counters()
+
+    def breakdown(prefix):
+        return {name[len(prefix):]: value for name, value in counters.items()
+                if name.startswith(prefix)}
+
+    return {
+        "total_sessions": counters.get("sessions", 0),
+        "total_messages": counters.get("messages", 0),
+        "by_language": breakdown("messages.language."),
+        "by_mode": breakdown("messages.mode."),
+        "by_role": breakdown("messages.role."),
+    }
 
 def create_session(session_id: str, language: str = "en", mode: str = "chat"):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO sessions (session_id, language, mode) VALUES (?, ?, ?)",
-        (session_id, language, mode)
-    )
-    conn.commit()
-    conn.close()
+    with write_transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO sessions (session_id, language, mode) VALUES (?, ?, ?)",
+            (session_id, language, mode)
+        )
 
-def save_message(session_id: str, role: str, content: str, language: str = "en", mode: str = "chat"):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+def _insert_message(conn, session_id, role, content, language, mode, outbox=False) -> int:
+    cursor = conn.execute(
         "INSERT INTO messages (session_id, role, content, language, mode) VALUES (?, ?, ?, ?, ?)",
         (session_id, role, content, language, mode)
     )
-    conn.commit()
-    conn.close()
+    if outbox:
+        conn.execute(
+            "INSERT OR IGNORE INTO sheets_outbox (message_id, enqueued_at) VALUES (?, ?)",
+            (cursor.lastrowid, time.time())
+        )
+    return cursor.lastrowid
+
+def save_message(session_id: str, role: str, content: str, language: str = "en",
+                 mode: str = "chat", outbox: bool = False) -> int:
+    """
+    Insert a message synchronously and return its row id.
+    outbox=True also queues it for the Google Sheets worker in the same transaction.
+    """
+    with write_transaction() as conn:
+        return _insert_message(conn, session_id, role, content, language, mode, outbox)
+
+def save_message_async(session_id: str, role: str, content: str, language: str = "en",
+                       mode: str = "chat", outbox: bool = False) -> Future:
+    """
+    Save a message and return a Future resolving to its row id.
+    With write-behind enabled the insert is queued and group-committed by the
+    background writer; otherwise it is written immediately.
+    """
+    if WRITE_BEHIND:
+        return _get_writer().submit((session_id, role, content, language, mode, outbox))
+    future = Future()
+    future.set_result(save_message(session_id, role, content, language, mode, outbox))
+    return future
+
+def get_ingested_hashes() -> set:
+    """Content hashes of every voicemail file already ingested."""
+    with connection() as conn:
+        return {row[0] for row in conn.execute("SELECT file_hash FROM ingested_files")}
+
+def save_ingested_batch(results: list, outbox: bool = False) -> int:
+    """
+    Store a batch of ingested voicemails in one transaction.
+    Each result: {file_hash, path, session_id, language, user_text, reply}.
+    Creates the session, the user + assistant messages and the ingested_files
+    checkpoint row; files already recorded are skipped. Returns rows stored.
+    """
+    stored = 0
+    with write_transaction() as conn:
+        for r in results:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO ingested_files (file_hash, path, session_id) VALUES (?, ?, ?)",
+                (r["file_hash"], r["path"], r["session_id"])
+            )
+            if cursor.rowcount == 0:
+                continue
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, language, mode) VALUES (?, ?, 'voice')",
+                (r["session_id"], r["language"])
+            )
+            _insert_message(conn, r["session_id"], "user", r["user_text"], r["language"], "voice")
+            _insert_message(conn, r["session_id"], "assistant", r["reply"], r["language"], "voice", outbox)
+            stored += 1
+    return stored
+
+def save_turn_timing(session_id: str, message_id: int, ttft_ms: float, total_ms: float,
+                     mode: str = "chat"):
+    with write_transaction() as conn:
+        conn.execute(
+            "INSERT INTO turn_timings (session_id, message_id, mode, ttft_ms, total_ms) VALUES (?, ?, ?, ?, ?)",
+            (session_id, message_id, mode, ttft_ms, total_ms)
+        )
+
+def get_turn_timing_summary(since: str = None) -> dict:
+    """Average / worst TTFT and total generation time per mode since a timestamp."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT mode, COUNT(*) AS turns,
+                   AVG(ttft_ms) AS avg_ttft_ms, MAX(ttft_ms) AS max_ttft_ms,
+                   AVG(total_ms) AS avg_total_ms, MAX(total_ms) AS max_total_ms
+            FROM turn_timings
+            WHERE timestamp >= ?
+            GROUP BY mode
+        """, (since or "",)).fetchall()
+    return {r["mode"]: dict(r) for r in rows}
+
+def _has_table(name: str) -> bool:
+    """Whether the current database already has the table, without creating the file."""
+    if DB_PATH in _initialized:
+        return True
+    if not os.path.exists(DB_PATH):
+        return False
+    with connection() as conn:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (name,)).fetchone() is not None
+
+def save_metrics(rows: list) -> int:
+    """
+    rows: (stage, duration_ms, ok, session_id, language, mode, recorded_at) tuples.
+    Returns how many were stored: none when the database was never set up (a
+    script that only imported ai_engine), so metrics never create a database.
+    """
+    if not _has_table("metrics"):
+        return 0
+    with write_transaction(stage=None, bump_generation=False) as conn:
+        conn.executemany(
+            "INSERT INTO metrics (stage, duration_ms, ok, session_id, language, mode, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    return len(rows)
+
+def prune_metrics(before: float) -> int:
+    """Delete spans recorded before a unix time."""
+    if not _has_table("metrics"):
+        return 0
+    with write_transaction(stage=None, bump_generation=False) as conn:
+        return conn.execute("DELETE FROM metrics WHERE recorded_at < ?", (before,)).rowcount
+
+def get_stage_latency(since: float, until: float = None, mode: str = None, language: str = None,
+                      bucket_seconds: float = None) -> list:
+    """
+    Nearest-rank p50/p95/p99 (plus count, errors, mean, max) of duration_ms
+    per stage for spans recorded in [since, until). With bucket_seconds the
+    rows are per (bucket, stage), bucket being the unix time it starts at.
+    """
+    clauses, params = ["recorded_at >= ?"], [since]
+    if until is not None:
+        clauses.append("recorded_at < ?")
+        params.append(until)
+    if mode:
+        clauses.append("mode = ?")
+        params.append(mode)
+    if language:
+        clauses.append("language = ?")
+        params.append(language)
+    bucket = f"CAST(recorded_at / {float(bucket_seconds)} AS INTEGER) * {float(bucket_seconds)}" \
+        if bucket_seconds else "NULL"
+    with connection() as conn:
+        rows = conn.execute(f"""
+            WITH ranked AS (
+                SELECT {bucket} AS bucket, stage, duration_ms, ok,
+                       ROW_NUMBER() OVER (PARTITION BY {bucket}, stage ORDER BY duration_ms) AS rn,
+                       COUNT(*) OVER (PARTITION BY {bucket}, stage) AS n
+                FROM metrics
+                WHERE {" AND ".join(clauses)}
+            )
+            SELECT bucket, stage, MAX(n) AS count, SUM(1 - ok) AS errors,
+                   AVG(duration_ms) AS mean_ms,
+                   MIN(CASE WHEN rn >= 0.50 * n THEN duration_ms END) AS p50_ms,
+                   MIN(CASE WHEN rn >= 0.95 * n THEN duration_ms END) AS p95_ms,
+                   MIN(CASE WHEN rn >= 0.99 * n THEN duration_ms END) AS p99_ms,
+                   MAX(duration_ms) AS max_ms
+            FROM ranked
+            GROUP BY bucket, stage
+            ORDER BY bucket, stage
+        """, params).fetchall()
+    return [dict(r) for r in rows]
+
+def get_session_summary(session_id: str, mode: str = "chat"):
+    """Return (summary, summarized_count); ("", 0) when there is none yet."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT summary, summarized_count FROM session_summaries WHERE session_id = ? AND mode = ?",
+            (session_id, mode)
+        ).fetchone()
+    return (row["summary"], row["summarized_count"]) if row else ("", 0)
+
+def save_session_summary(session_id: str, mode: str, summary: str, summarized_count: int):
+    with write_transaction() as conn:
+        conn.execute("""
+            INSERT INTO session_summaries (session_id, mode, summary, summarized_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(session_id, mode) DO UPDATE SET
+                summary = excluded.summary,
+                summarized_count = excluded.summarized_count,
+                updated_at = datetime('now')
+        """, (session_id, mode, summary, summarized_count))
 
 def get_session_messages(session_id: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id",
-        (session_id,)
-    )
-    rows = cursor.fetchall()
-    conn.close()
+    flush_writes()  # read-your-writes when write-behind is on
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        ).fetchall()
     return [dict(r) for r in rows]
 
 def get_all_sessions():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT s.session_id, s.language, s.mode, s.created_at,
-               COUNT(m.id) AS message_count
-        FROM sessions s
-        LEFT JOIN messages m ON s.session_id = m.session_id
-        GROUP BY s.session_id
-        ORDER BY s.created_at DESC
-    """)
-    rows = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT s.session_id, s.language, s.mode, s.created_at,
+                   (SELECT COUNT(*) FROM messages m
+                    WHERE m.session_id = s.session_id) AS message_count
+            FROM sessions s
+            ORDER BY s.created_at DESC
+        """).fetchall()
     return [dict(r) for r in rows]
 
+def _filters(alias: str, time_column: str, language=None, mode=None,
+             start=None, end=None, **equals):
+    """Build a WHERE fragment + params for the optional browse filters."""
+    clauses, params = [], []
+    for column, value in (("language", language), ("mode", mode), *equals.items()):
+        if value:
+            clauses.append(f"{alias}.{column} = ?")
+            params.append(value)
+    if start:
+        clauses.append(f"{alias}.{time_column} >= ?")
+        params.append(str(start))
+    if end:
+        clauses.append(f"{alias}.{time_column} < ?")
+        params.append(str(end))
+    return clauses, params
+
+def get_sessions_page(limit: int = 50, cursor: tuple = None, language: str = None,
+                      mode: str = None, start: str = None, end: str = None):
+    """
+    Keyset-paginated sessions, newest first.
+    cursor is the opaque value returned by the previous page (None for the
+    first page); start/end bound created_at ('YYYY-MM-DD[ HH:MM:SS]', end exclusive).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    clauses, params = _filters("s", "created_at", language, mode, start, end)
+    if cursor:
+        clauses.append("(s.created_at, s.id) < (?, ?)")
+        params.extend(cursor)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    with connection() as conn:
+        rows = conn.execute(f"""
+            SELECT s.id, s.session_id, s.language, s.mode, s.created_at,
+                   (SELECT COUNT(*) FROM messages m
+                    WHERE m.session_id = s.session_id) AS message_count
+            FROM sessions s
+            {where}
+            ORDER BY s.created_at DESC, s.id DESC
+            LIMIT ?
+        """, (*params, limit + 1)).fetchall()
+    rows = [dict(r) for r in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]["created_at"], rows[-1]["id"])
+    return rows, next_cursor
+
+def get_messages_page(limit: int = 50, cursor: int = None, session_id: str = None,
+                      role: str = None, language: str = None, mode: str = None,
+                      start: str = None, end: str = None):
+    """
+    Keyset-paginated messages, newest first (same contract as get_sessions_page;
+    the cursor is the last message id seen, start/end bound the timestamp).
+    """
+    clauses, params = _filters("m", "timestamp", language, mode, start, end,
+                               session_id=session_id, role=role)
+    if cursor:
+        clauses.append("m.id < ?")
+        params.append(cursor)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    with connection() as conn:
+        rows = conn.execute(f"""
+            SELECT m.id, m.session_id, m.role, m.content, m.language, m.mode, m.timestamp
+            FROM messages m
+            {where}
+            ORDER BY m.id DESC
+            LIMIT ?
+        """, (*params, limit + 1)).fetchall()
+    rows = [dict(r) for r in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    return rows, next_cursor
+
+# ─────────────────────────────────────────────
+# Persisted sync state
+# ─────────────────────────────────────────────
+def _set_sync_state(conn, key: str, value):
+    conn.execute("""
+        INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, datetime('now'))
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """, (key, None if value is None else str(value)))
+
+def get_sync_state(key: str, default=None):
+    with connection() as conn:
+        row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row and row["value"] is not None else default
+
+def set_sync_state(key: str, value):
+    with write_transaction(bump_generation=False) as conn:
+        _set_sync_state(conn, key, value)
+
+# ─────────────────────────────────────────────
+# Cache entries (see utils/cache.py)
+# ─────────────────────────────────────────────
+# LRU touches (last_used_at, hits) are collected in memory and written in one
+# transaction at most every CACHE_TOUCH_SECONDS, so cache reads stay read-only.
+CACHE_TOUCH_SECONDS = float(os.getenv("CACHE_TOUCH_SECONDS", "30"))
+_pending_touches = {}   # (namespace, key) -> [last_used_at, hits]
+_pending_touches_since = 0.0
+_touch_lock = threading.Lock()
+
+def cache_get(namespace: str, key: str):
+    """Return (value, expires_at), or None if missing/expired. Bumps its LRU position."""
+    global _pending_touches_since
+    now = time.time()
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, now)
+        ).fetchone()
+    if row is None:
+        return None
+    with _touch_lock:
+        touch = _pending_touches.get((namespace, key))
+        if touch is None:
+            if not _pending_touches:
+                _pending_touches_since = now
+            _pending_touches[(namespace, key)] = [now, 1]
+        else:
+            touch[0] = now
+            touch[1] += 1
+        due = now - _pending_touches_since >= CACHE_TOUCH_SECONDS
+    if due:
+        flush_cache_touches()
+    return row["value"], row["expires_at"]
+
+def flush_cache_touches():
+    """Write the LRU touches collected by cache_get."""
+    global _pending_touches
+    with _touch_lock:
+        touches, _pending_touches = _pending_touches, {}
+    if not touches:
+        return
+    with write_transaction(bump_generation=False) as conn:
+        conn.executemany(
+            "UPDATE cache_entries SET last_used_at = MAX(last_used_at, ?), hits = hits + ? "
+            "WHERE namespace = ? AND key = ?",
+            [(used, hits, namespace, key) for (namespace, key), (used, hits) in touches.items()]
+        )
+
+def cache_put(namespace: str, key: str, value: str, ttl: float):
+    now = time.time()
+    with write_transaction(bump_generation=False) as conn:
+        conn.execute("""
+            INSERT INTO cache_entries (namespace, key, value, expires_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(namespace, key) DO UPDATE SET
+                value = excluded.value,
+                expires_at = excluded.expires_at,
+                last_used_at = excluded.last_used_at
+        """, (namespace, key, value, now + ttl, now))
+
+def cache_evict(namespace: str, max_entries: int) -> int:
+    """Drop expired entries, then least-recently-used ones beyond max_entries."""
+    flush_cache_touches()
+    with write_transaction(bump_generation=False) as conn:
+        removed = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+            (namespace, time.time())
+        ).rowcount
+        removed += conn.execute("""
+            DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                SELECT key FROM cache_entries WHERE namespace = ?
+                ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (namespace, namespace, max_entries)).rowcount
+    return removed
+
+def cache_clear(namespace: str):
+    with write_transaction(bump_generation=False) as conn:
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+# ─────────────────────────────────────────────
+# Google Sheets watermark sync
+# ─────────────────────────────────────────────
+def get_messages_after(after_id: int, limit: int = 500) -> list:
+    """
+    Messages with id > after_id in id order, for incremental sync.
+    Each row carries in_outbox=1 when the Sheets outbox owns its delivery.
+    """
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT m.id, m.session_id, m.role, m.content, m.language, m.mode, m.timestamp,
+                   (o.message_id IS NOT NULL) AS in_outbox
+            FROM messages m
+            LEFT JOIN sheets_outbox o ON o.message_id = m.id
+            WHERE m.id > ?
+            ORDER BY m.id
+            LIMIT ?
+        """, (after_id, limit)).fetchall()
+    return [dict(r) for r in rows]
+
+def get_message_languages_after(after_id: int, limit: int = 5000) -> list:
+    """(id, content, language) tuples with id > after_id in id order (keyset scan)."""
+    with connection() as conn:
+        return [tuple(r) for r in conn.execute(
+            "SELECT id, content, language FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        )]
+
+def update_message_languages(changes: list) -> int:
+    """Apply (language, message_id) pairs in one transaction; counter triggers follow."""
+    if not changes:
+        return 0
+    with write_transaction() as conn:
+        conn.executemany("UPDATE messages SET language = ? WHERE id = ?", changes)
+    return len(changes)
+
+def advance_sheets_watermark(key: str, last_id: int):
+    """
+    Move the sync high-water mark and drop delivered outbox entries below it
+    (the watermark sync never looks below it again, so they are not needed for dedup).
+    """
+    with write_transaction(bump_generation=False) as conn:
+        _set_sync_state(conn, key, last_id)
+        conn.execute(
+            "DELETE FROM sheets_outbox WHERE delivered_at IS NOT NULL AND message_id <= ?",
+            (last_id,)
+        )
+
+# ─────────────────────────────────────────────
+# Google Sheets outbox
+# ─────────────────────────────────────────────
+def claim_outbox_batch(limit: int = 100, lease: float = 60.0) -> list:
+    """
+    Claim up to `limit` due outbox entries (oldest message first).
+    Claiming bumps attempts and pushes next_attempt_at out by `lease` seconds,
+    so a crash mid-delivery leaves the entry to be retried later. Returns the
+    message rows with an extra `attempts` field (1 = first delivery attempt).
+    """
+    now = time.time()
+    # Idle polls only read: no write lock, no sqlite.write span.
+    with connection() as conn:
+        due = conn.execute(
+            "SELECT 1 FROM sheets_outbox WHERE delivered_at IS NULL AND next_attempt_at <= ? LIMIT 1", (now,)
+        ).fetchone()
+    if due is None:
+        return []
+    with write_transaction() as conn:
+        rows = conn.execute("""
+            SELECT m.id, m.session_id, m.role, m.content, m.language, m.mode, m.timestamp,
+                   o.attempts + 1 AS attempts
+            FROM sheets_outbox o
+            JOIN messages m ON m.id = o.message_id
+            WHERE o.delivered_at IS NULL AND o.next_attempt_at <= ?
+            ORDER BY o.message_id
+            LIMIT ?
+        """, (now, limit)).fetchall()
+        conn.executemany(
+            "UPDATE sheets_outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE message_id = ?",
+            [(now + lease, r["id"]) for r in rows]
+        )
+    return [dict(r) for r in rows]
+
+def mark_outbox_delivered(message_ids: list):
+    now = time.time()
+    with write_transaction() as conn:
+        conn.executemany(
+            "UPDATE sheets_outbox SET delivered_at = ?, last_error = NULL WHERE message_id = ?",
+            [(now, message_id) for message_id in message_ids]
+        )
+
+def mark_outbox_failed(retry_at: dict, error: str):
+    """retry_at maps message_id -> unix time of the next attempt."""
+    with write_transaction() as conn:
+        conn.executemany(
+            "UPDATE sheets_outbox SET next_attempt_at = ?, last_error = ? WHERE message_id = ?",
+            [(when, error[:500], message_id) for message_id, when in retry_at.items()]
+        )
+
+def get_outbox_stats() -> dict:
+    """Depth and lag of the Sheets outbox for the dashboard."""
+    with connection() as conn:
+        row = conn.execute("""
+            SELECT COUNT(*) AS pending,
+                   MIN(enqueued_at) AS oldest_enqueued_at,
+                   SUM(last_error IS NOT NULL) AS retrying
+            FROM sheets_outbox
+            WHERE delivered_at IS NULL
+        """).fetchone()
+        last_error = conn.execute("""
+            SELECT last_error FROM sheets_outbox
+            WHERE delivered_at IS NULL AND last_error IS NOT NULL
+            ORDER BY next_attempt_at DESC LIMIT 1
+        """).fetchone()
+    oldest = row["oldest_enqueued_at"]
+    return {
+        "pending": row["pending"],
+        "retrying": row["retrying"] or 0,
+        "lag_seconds": (time.time() - oldest) if oldest else 0.0,
+        "last_error": last_error["last_error"] if last_error else None,
+    }
+
 def save_feedback(session_id: str, rating: int, comment: str = ""):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO feedback (session_id, rating, comment) VALUES (?, ?, ?)",
-        (session_id, rating, comment)
-    )
-    conn.commit()
-    conn.close()
+    with write_transaction() as conn:
+        conn.execute(
+            "INSERT INTO feedback (session_id, rating, comment) VALUES (?, ?, ?)",
+            (session_id, rating, comment)
+        )
 
 def get_all_messages_flat():
     """Return all messages for Google Sheets export."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT m.id, m.session_id, m.role, m.content, m.language, m.mode, m.timestamp
-        FROM messages m
-        ORDER BY m.id DESC
-        LIMIT 1000
-    """)
-    rows = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT m.id, m.session_id, m.role, m.content, m.language, m.mode, m.timestamp
+            FROM messages m
+            ORDER BY m.id DESC
+            LIMIT 1000
+        """).fetchall()
     return [dict(r) for r in rows]
+
+
+# ─────────────────────────────────────────────
+# Write-behind queue
+# ─────────────────────────────────────────────
+_FLUSH = object()
+_STOP = object()
+
+
+class MessageWriter:
+    """
+    Background writer that group-commits queued message inserts.
+    A batch is written when it reaches batch_size items or flush_interval
+    seconds after its first item, whichever comes first.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_MS / 1000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="db-message-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: tuple) -> Future:
+        future = Future()
+        with self._lock:
+            self._pending += 1
+        self._queue.put((row, future))
+        return future
+
+    def flush(self, timeout: float = None):
+        """Block until everything queued so far is committed."""
+        if not self._pending or not self._thread.is_alive():
+            return
+        marker = Future()
+        self._queue.put((_FLUSH, marker))
+        marker.result(timeout)
+
+    def close(self, timeout: float = None):
+        """Flush outstanding writes and stop the writer thread."""
+        if not self._thread.is_alive():
+            return
+        marker = Future()
+        self._queue.put((_STOP, marker))
+        marker.result(timeout)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = []
+            markers = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item[0] is _FLUSH or item[0] is _STOP:
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+            for kind, marker in markers:
+                marker.set_result(None)
+                if kind is _STOP:
+                    return
+
+    def _write(self, batch):
+        try:
+            with write_transaction() as conn:
+                ids = [_insert_message(conn, *row) for row, _ in batch]
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for (_, future), row_id in zip(batch, ids):
+                future.set_result(row_id)
+        finally:
+            with self._lock:
+                self._pending -= len(batch)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> MessageWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = MessageWriter()
+    return _writer
+
+
+def enable_write_behind(enabled: bool = True):
+    """Turn write-behind on or off at runtime (off drains the queue first)."""
+    global WRITE_BEHIND
+    if not enabled:
+        shutdown_writer()
+    WRITE_BEHIND = enabled
+
+
+def flush_writes(timeout: float = None):
+    """Wait until all queued message inserts are committed."""
+    if _writer is not None:
+        _writer.flush(timeout)
+
+
+def shutdown_writer(timeout: float = None):
+    """Durably flush the write-behind queue and stop its thread."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close(timeout)
+
+
+atexit.register(shutdown_writer)
@@ -0,0 +1,220 @@
+"""
+utils/export.py
+Snapshot-consistent, streaming exports of the conversation tables.
+
+The live database is first copied with the SQLite online backup API, which
+reads one consistent point in time without blocking the app's writers (WAL).
+Tables are then streamed from the copy in EXPORT_CHUNK_ROWS-sized chunks into
+gzip-compressed CSV or JSONL, or Parquet when pyarrow is installed, so memory
+stays flat however large the tables are.
+
+    with open_snapshot() as snap:
+        path, rows = export_table(snap, "messages", "jsonl", start="2024-06-01")
+
+Used by the dashboard's Export section and `python cli.py export`.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from utils.database import connection
+
+EXPORT_DIR = os.getenv(
+    "EXPORT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "exports")
+)
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+EXPORT_KEEP_SECONDS = float(os.getenv("EXPORT_KEEP_SECONDS", str(24 * 3600)))
+
+# Exportable tables and the timestamp column the date filter applies to
+EXPORT_TABLES = {"messages": "timestamp", "sessions": "created_at", "feedback": "timestamp"}
+EXPORT_FORMATS = {"csv": ".csv.gz", "jsonl": ".jsonl.gz", "parquet": ".parquet"}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# ─────────────────────────────────────────────
+# Snapshot
+# ─────────────────────────────────────────────
+def snapshot(dest: str) -> str:
+    """Copy the live database to dest as one consistent, self-contained file."""
+    target = sqlite3.connect(dest)
+    try:
+        with connection() as source:
+            source.backup(target)
+        target.execute("PRAGMA journal_mode=DELETE")  # no -wal sidecar in the copy
+    finally:
+        target.close()
+    return dest
+
+
+def export_database(directory: str = None) -> str:
+    """Snapshot the whole database to conversations-<time>.db in directory (EXPORT_DIR)."""
+    directory = directory or EXPORT_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"conversations-{time.strftime('%Y%m%d-%H%M%S')}.db")
+    partial = path + ".part"
+    try:
+        snapshot(partial)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return path
+
+
+@contextmanager
+def open_snapshot(directory: str = None):
+    """Yield the path of a temporary snapshot; it is deleted afterwards."""
+    directory = directory or EXPORT_DIR
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="snapshot-", suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        yield snapshot(path)
+    finally:
+        os.remove(path)
+
+
+# ─────────────────────────────────────────────
+# Streaming writers
+# ─────────────────────────────────────────────
+def iter_chunks(snapshot_path: str, table: str, start: str = None, end: str = None,
+                chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Yield (columns, rows) chunks of a table in rowid order; [start, end) filters its timestamp."""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export table: {table}")
+    column = EXPORT_TABLES[table]
+    clauses, params = [], []
+    if start:
+        clauses.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} < ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(f"SELECT * FROM {table} {where} ORDER BY rowid", params)
+        columns = [d[0] for d in cursor.description]
+        rows = cursor.fetchmany(chunk_rows)
+        yield columns, rows   # even when empty, so a CSV still gets its header
+        while rows:
+            rows = cursor.fetchmany(chunk_rows)
+            if rows:
+                yield columns, rows
+    finally:
+        conn.close()
+
+
+def _column_types(snapshot_path: str, table: str) -> dict:
+    conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    try:
+        return {r[1]: (r[2] or "").upper() for r in conn.execute(f"PRAGMA table_info({table})")}
+    finally:
+        conn.close()
+
+
+def _write_csv(chunks, out) -> int:
+    written = 0
+    with gzip.GzipFile(fileobj=out, mode="wb") as gz, \
+            io.TextIOWrapper(gz, encoding="utf-8", newline="") as text:
+        writer = csv.writer(text)
+        header = False
+        for columns, rows in chunks:
+            if not header:
+                writer.writerow(columns)
+                header = True
+            writer.writerows(rows)
+            written += len(rows)
+    return written
+
+
+def _write_jsonl(chunks, out) -> int:
+    written = 0
+    with gzip.GzipFile(fileobj=out, mode="wb") as gz, \
+            io.TextIOWrapper(gz, encoding="utf-8", newline="\n") as text:
+        for columns, rows in chunks:
+            text.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+            written += len(rows)
+    return written
+
+
+def _write_parquet(chunks, out, types: dict) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def arrow_type(declared: str):
+        if "INT" in declared:
+            return pa.int64()
+        if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+            return pa.float64()
+        return pa.string()
+
+    schema = pa.schema([(name, arrow_type(declared)) for name, declared in types.items()])
+    written = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for columns, rows in chunks:
+            batch = {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+            writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+            written += len(rows)
+    return written
+
+
+def write_export(snapshot_path: str, table: str, fmt: str, out, start: str = None,
+                 end: str = None) -> int:
+    """Stream one table of a snapshot into a binary file object; returns the row count."""
+    chunks = iter_chunks(snapshot_path, table, start, end)
+    if fmt == "csv":
+        return _write_csv(chunks, out)
+    if fmt == "jsonl":
+        return _write_jsonl(chunks, out)
+    if fmt == "parquet":
+        if not parquet_available():
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        return _write_parquet(chunks, out, _column_types(snapshot_path, table))
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_table(snapshot_path: str, table: str, fmt: str, directory: str = None,
+                 start: str = None, end: str = None):
+    """Write <table>-<time>.<ext> into directory (EXPORT_DIR); returns (path, rows)."""
+    directory = directory or EXPORT_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{table}-{time.strftime('%Y%m%d-%H%M%S')}{EXPORT_FORMATS[fmt]}")
+    partial = path + ".part"
+    try:
+        with open(partial, "wb") as out:
+            rows = write_export(snapshot_path, table, fmt, out, start, end)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return path, rows
+
+
+def prune_exports(directory: str = None, max_age: float = EXPORT_KEEP_SECONDS) -> int:
+    """Delete exports older than max_age seconds."""
+    directory = directory or EXPORT_DIR
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
@@ -0,0 +1,107 @@
+"""
+utils/fake_gspread.py
+In-memory stand-in for the parts of gspread this app uses.
+
+Used to exercise the Sheets outbox worker and to benchmark offline:
+    GOOGLE_SHEETS_BACKEND=fake   (see utils/sheets.get_sheet_client)
+or inject directly with sheets.set_sheet_client(FakeClient(...)).
+"""
+import random
+import threading
+import time
+import gspread
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+class FakeAPIError(Exception):
+    """Mimics gspread.exceptions.APIError closely enough for status checks."""
+
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(message or f"Fake Sheets API error {status_code}")
+        self.response = FakeResponse(status_code)
+
+
+class FakeWorksheet:
+    def __init__(self, client, title: str):
+        self.client = client
+        self.title = title
+        self.rows = []
+        self._lock = threading.Lock()
+
+    def append_row(self, values, value_input_option=None):
+        self.append_rows([values], value_input_option)
+
+    def append_rows(self, values, value_input_option=None):
+        self.client._call()
+        with self._lock:
+            self.rows.extend([list(v) for v in values])
+
+    def col_values(self, col: int):
+        self.client._call()
+        with self._lock:
+            return [str(r[col - 1]) if len(r) >= col else "" for r in self.rows]
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, key: str):
+        self.client = client
+        self.id = key
+        self._worksheets = {}
+
+    def worksheet(self, title: str):
+        self.client._call()
+        if title not in self._worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26):
+        self.client._call()
+        ws = FakeWorksheet(self.client, title)
+        self._worksheets[title] = ws
+        return ws
+
+
+class FakeClient:
+    """
+    latency: seconds added to every API call (plus up to `jitter` extra).
+    error_rate: probability that a call raises FakeAPIError(error_status).
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = 0
+        self._forced_errors = []
+        self._spreadsheets = {}
+        self._lock = threading.Lock()
+
+    def fail_next(self, count: int = 1, status: int = 500):
+        """Make the next `count` API calls raise FakeAPIError(status)."""
+        with self._lock:
+            self._forced_errors.extend([status] * count)
+
+    def open_by_key(self, key: str):
+        self._call()
+        with self._lock:
+            if key not in self._spreadsheets:
+                self._spreadsheets[key] = FakeSpreadsheet(self, key)
+            return self._spreadsheets[key]
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+            forced = self._forced_errors.pop(0) if self._forced_errors else None
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if forced is not None:
+            raise FakeAPIError(forced)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeAPIError(self.error_status)
@@ -0,0 +1,297 @@
+"""
+utils/llm_backend.py
+Backends behind ai_engine's chat, transcription and speech calls.
+
+OpenAIBackend keeps one pooled keep-alive HTTP client per process and gives
+every call a deadline. Transient failures (timeouts, dropped connections,
+408/409/429/5xx) are retried a bounded number of times with jittered
+exponential backoff, and a semaphore caps concurrent requests.
+
+FakeBackend is a local stand-in with configurable latency and error profiles,
+for load tests and offline benchmarks:
+    LLM_BACKEND=fake LLM_FAKE_LATENCY_MS=300 LLM_FAKE_ERROR_RATE=0.05
+or inject directly with llm_backend.set_backend(FakeBackend(...)).
+"""
+import io
+import os
+import random
+import threading
+import time
+from utils.text import detect_language
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))     # per attempt
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))   # whole call incl. retries
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class Backend:
+    """
+    Retry / deadline / concurrency policy shared by the backends.
+    Subclasses implement chat, chat_stream, transcribe and synthesize on top
+    of _call(attempt, deadline), where attempt(timeout) performs one try.
+    """
+
+    def __init__(self, timeout: float = LLM_TIMEOUT_SECONDS, deadline: float = LLM_DEADLINE_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES, base_backoff: float = LLM_BACKOFF_BASE,
+                 max_backoff: float = LLM_BACKOFF_MAX, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def is_retryable(self, error: Exception) -> bool:
+        status = getattr(error, "status_code", None)
+        if status is None:
+            status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is not None:
+            return status in RETRYABLE_STATUS
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** max(attempts - 1, 0)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _call(self, attempt, deadline: float = None):
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        with self._stats_lock:
+            self.calls += 1
+        for attempts in range(1, self.max_retries + 2):
+            remaining = deadline_at - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise TimeoutError("deadline exceeded")
+                if not self._slots.acquire(timeout=remaining):
+                    raise TimeoutError("deadline exceeded waiting for a free request slot")
+                try:
+                    return attempt(min(self.timeout, remaining))
+                finally:
+                    self._slots.release()
+            except Exception as e:
+                delay = self.backoff(attempts)
+                if (attempts > self.max_retries or not self.is_retryable(e)
+                        or time.monotonic() + delay >= deadline_at):
+                    with self._stats_lock:
+                        self.failures += 1
+                    raise
+                with self._stats_lock:
+                    self.retries += 1
+                time.sleep(delay)
+
+    def use_slots(self, slots):
+        """Draw request slots from `slots` instead, e.g. a multiprocessing
+        semaphore shared by several worker processes."""
+        self._slots = slots
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"backend": type(self).__name__, "calls": self.calls,
+                    "retries": self.retries, "failures": self.failures}
+
+
+class OpenAIBackend(Backend):
+    """OpenAI chat + Whisper over a pooled HTTP client; gTTS for speech."""
+
+    def __init__(self, api_key: str = None, **kwargs):
+        super().__init__(**kwargs)
+        import openai
+        self._openai = openai
+        # One client per backend keeps the SDK's own keep-alive connection
+        # pool; the request-slot semaphore bounds how many connections it
+        # opens. The SDK's HTTP library is left to the SDK (it has changed
+        # between releases), so nothing here imports it directly.
+        self.client = openai.OpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            max_retries=0,   # retries are ours (jittered, deadline-aware)
+            timeout=self.timeout,
+        )
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, self._openai.APIConnectionError):  # includes APITimeoutError
+            return True
+        if error.__class__.__name__ == "gTTSError":
+            rsp = getattr(error, "rsp", None)
+            return rsp is None or rsp.status_code in RETRYABLE_STATUS
+        if error.__class__.__module__.startswith("requests"):
+            return error.__class__.__name__ in ("ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout")
+        return super().is_retryable(error)
+
+    def chat(self, messages: list, model: str, temperature: float, max_tokens: int,
+             deadline: float = None) -> str:
+        def attempt(timeout):
+            response = self.client.chat.completions.create(
+                model=model, messages=messages, temperature=temperature,
+                max_tokens=max_tokens, timeout=timeout,
+            )
+            return response.choices[0].message.content.strip()
+        return self._call(attempt, deadline)
+
+    def chat_stream(self, messages: list, model: str, temperature: float, max_tokens: int,
+                    deadline: float = None):
+        """Yield text deltas. Only opening the stream is retried."""
+        stream = self._call(lambda timeout: self.client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature,
+            max_tokens=max_tokens, stream=True, timeout=timeout,
+        ), deadline)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def transcribe(self, audio_bytes: bytes, filename: str, language: str, model: str = "whisper-1",
+                   deadline: float = None) -> str:
+        def attempt(timeout):
+            audio_file = io.BytesIO(audio_bytes)
+            audio_file.name = filename
+            transcript = self.client.audio.transcriptions.create(
+                model=model, file=audio_file, language=language, timeout=timeout,
+            )
+            return transcript.text.strip()
+        return self._call(attempt, deadline)
+
+    def synthesize(self, text: str, language: str, deadline: float = None) -> bytes:
+        from gtts import gTTS
+
+        def attempt(timeout):
+            buffer = io.BytesIO()
+            gTTS(text=text, lang=language, slow=False, timeout=timeout).write_to_fp(buffer)
+            return buffer.getvalue()
+        return self._call(attempt, deadline)
+
+
+class FakeLLMError(Exception):
+    """Mimics an API status error closely enough for retry classification."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Fake LLM API error {status_code}")
+        self.status_code = status_code
+
+
+FAKE_REPLIES = {
+    "en": ("Thanks for reaching out. I understand the issue with {topic}. "
+           "Please sign out on all devices and sign in again. "
+           "If the problem continues, a specialist will contact you within 24 hours."),
+    "ar": ("شكراً لتواصلك معنا. أفهم المشكلة المتعلقة بـ {topic}. "
+           "يرجى تسجيل الخروج من جميع الأجهزة ثم تسجيل الدخول مرة أخرى. "
+           "إذا استمرت المشكلة، سيتواصل معك أحد المختصين خلال 24 ساعة."),
+}
+
+
+class FakeBackend(Backend):
+    """
+    latency: seconds per call (plus up to `jitter` extra); a streamed reply
+    waits `ttft` before its first word, then emits tokens_per_second words/s.
+    error_rate: probability that an attempt fails with FakeLLMError(error_status).
+    Attempts that would outlast their timeout raise TimeoutError instead.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, ttft: float = None,
+                 tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, **kwargs):
+        kwargs.setdefault("base_backoff", 0.05)
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.ttft = latency if ttft is None else ttft
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.attempts = 0
+        self._forced_errors = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=float(os.getenv("LLM_FAKE_LATENCY_MS", "0")) / 1000,
+            jitter=float(os.getenv("LLM_FAKE_JITTER_MS", "0")) / 1000,
+            ttft=float(os.getenv("LLM_FAKE_TTFT_MS")) / 1000 if os.getenv("LLM_FAKE_TTFT_MS") else None,
+            tokens_per_second=float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "0")),
+            error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", "0")),
+            error_status=int(os.getenv("LLM_FAKE_ERROR_STATUS", "503")),
+        )
+
+    def fail_next(self, count: int = 1, status: int = 503):
+        """Make the next `count` attempts raise FakeLLMError(status)."""
+        with self._stats_lock:
+            self._forced_errors.extend([status] * count)
+
+    def _attempt(self, timeout: float, delay: float):
+        with self._stats_lock:
+            self.attempts += 1
+            forced = self._forced_errors.pop(0) if self._forced_errors else None
+        delay += random.uniform(0, self.jitter)
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise TimeoutError(f"fake call exceeded {timeout:.1f}s")
+        if forced is not None:
+            raise FakeLLMError(forced)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeLLMError(self.error_status)
+
+    @staticmethod
+    def reply_for(messages: list) -> str:
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        topic = " ".join(question.split()[:6]) or "your account"
+        return FAKE_REPLIES[detect_language(question)].format(topic=topic)
+
+    def chat(self, messages: list, model: str = None, temperature: float = None,
+             max_tokens: int = None, deadline: float = None) -> str:
+        def attempt(timeout):
+            self._attempt(timeout, self.latency)
+            return self.reply_for(messages)
+        return self._call(attempt, deadline)
+
+    def chat_stream(self, messages: list, model: str = None, temperature: float = None,
+                    max_tokens: int = None, deadline: float = None):
+        self._call(lambda timeout: self._attempt(timeout, self.ttft), deadline)
+        words = self.reply_for(messages).split(" ")
+        for i, word in enumerate(words):
+            if i and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield word if i == 0 else " " + word
+
+    def transcribe(self, audio_bytes: bytes, filename: str, language: str, model: str = None,
+                   deadline: float = None) -> str:
+        def attempt(timeout):
+            self._attempt(timeout, self.latency)
+            if language == "ar":
+                return "لا أستطيع تسجيل الدخول إلى حسابي"
+            return "I can't log in to my account"
+        return self._call(attempt, deadline)
+
+    def synthesize(self, text: str, language: str, deadline: float = None) -> bytes:
+        def attempt(timeout):
+            self._attempt(timeout, self.latency)
+            return b"ID3" + bytes(160 * len(text))  # roughly gTTS-sized MP3 payload
+        return self._call(attempt, deadline)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Backend:
+    """The process-wide backend (LLM_BACKEND=openai|fake, or set_backend)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = FakeBackend.from_env() if LLM_BACKEND == "fake" else OpenAIBackend()
+        return _backend
+
+
+def set_backend(backend: Backend):
+    """Swap the backend (tests, benchmarks, load tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
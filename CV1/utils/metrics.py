@@ -0,0 +1,177 @@
+"""
+utils/metrics.py
+Per-stage latency spans (Whisper, LLM, gTTS, SQLite, Google Sheets).
+
+    with metrics.span("whisper", language="ar"):
+        ...
+    metrics.record("llm.ttft", 412.0, session_id=sid, mode="voice")
+
+Spans are tagged with session_id / language / mode: explicitly, or from the
+surrounding metrics.tagged(...) block (utils/turns.py opens one per turn).
+They are buffered in memory and a background thread writes them to the
+metrics table in batches; the dashboard reads percentiles per stage from
+there (database.get_stage_latency).
+
+METRICS_ENABLED=0 turns every call here into a no-op.
+"""
+import atexit
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_BATCH_SIZE = int(os.getenv("METRICS_BATCH_SIZE", "500"))
+METRICS_MAX_BUFFER = int(os.getenv("METRICS_MAX_BUFFER", "20000"))   # spans dropped beyond this
+METRICS_RETENTION_DAYS = float(os.getenv("METRICS_RETENTION_DAYS", "14"))
+
+_tags = contextvars.ContextVar("metrics_tags", default={})
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("stage", "tags", "started")
+
+    def __init__(self, stage: str, tags: dict):
+        self.stage = stage
+        self.tags = tags
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.stage, (time.perf_counter() - self.started) * 1000, ok=exc_type is None, **self.tags)
+        return False
+
+
+def span(stage: str, **tags):
+    """Context manager timing one stage; failures are recorded with ok=0 (stage=None: no-op)."""
+    if not METRICS_ENABLED or stage is None:
+        return _NULL_SPAN
+    return _Span(stage, tags)
+
+
+def record(stage: str, duration_ms: float, ok: bool = True, **tags):
+    """Buffer one measurement; explicit tags win over the tagged() ones."""
+    if not METRICS_ENABLED or duration_ms is None:
+        return
+    merged = {**_tags.get(), **tags}
+    _buffer.add((stage, float(duration_ms), int(ok), merged.get("session_id"),
+                 merged.get("language"), merged.get("mode"), time.time()))
+
+
+@contextmanager
+def tagged(**tags):
+    """Tag every span recorded inside the block (same thread / context)."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def bind(fn):
+    """Wrap fn so it keeps the caller's tags when run on a thread pool."""
+    if not METRICS_ENABLED:
+        return fn
+    tags = _tags.get()
+
+    def run(*args, **kwargs):
+        token = _tags.set(tags)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _tags.reset(token)
+    return run
+
+
+# ─────────────────────────────────────────────
+# Buffer + background flush
+# ─────────────────────────────────────────────
+class _Buffer:
+    PRUNE_EVERY = 3600.0  # seconds between retention sweeps
+
+    def __init__(self):
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+        self.dropped = 0
+        self.written = 0
+
+    def add(self, row: tuple):
+        with self._lock:
+            if len(self._rows) >= METRICS_MAX_BUFFER:
+                self.dropped += 1
+                return
+            self._rows.append(row)
+            full = len(self._rows) >= METRICS_BATCH_SIZE
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            from utils.database import save_metrics
+            saved = save_metrics(rows)   # 0 when the database has no metrics table
+            with self._lock:
+                self.written += saved
+                self.dropped += len(rows) - saved
+        now = time.time()
+        if METRICS_RETENTION_DAYS and now - self._last_prune > self.PRUNE_EVERY:
+            from utils.database import prune_metrics
+            self._last_prune = now
+            prune_metrics(now - METRICS_RETENTION_DAYS * 86400)
+
+    def _run(self):
+        while True:
+            self._wake.wait(METRICS_FLUSH_SECONDS)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # metrics must never break the app; the batch is dropped
+
+
+_buffer = _Buffer()
+
+
+def flush():
+    """Write buffered spans now (tests, benchmarks, shutdown)."""
+    _buffer.flush()
+
+
+def stats() -> dict:
+    with _buffer._lock:
+        buffered = len(_buffer._rows)
+    return {"enabled": METRICS_ENABLED, "buffered": buffered,
+            "written": _buffer.written, "dropped": _buffer.dropped}
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
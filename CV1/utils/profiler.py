@@ -0,0 +1,97 @@
+"""
+utils/profiler.py
+Opt-in cProfile hook around each Streamlit rerun (PROFILE_RERUNS=1).
+
+app.py wraps its page routing in profile_rerun(page). Reruns slower than
+PROFILE_MIN_MS are saved as pstats files in PROFILE_DIR, keeping the newest
+PROFILE_KEEP; the dashboard lists the slowest ones. Inspect a download with
+`python -m pstats file.prof`, or as a flame graph with `snakeviz file.prof`.
+
+Only one rerun is profiled at a time (cProfile cannot run concurrently);
+reruns that overlap with a profiled one simply run unprofiled.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_RERUNS = os.getenv("PROFILE_RERUNS", "0") == "1"
+PROFILE_MIN_MS = float(os.getenv("PROFILE_MIN_MS", "100"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "profiles")
+)
+
+# <unix ms>_<page>_<duration ms>.prof
+_NAME = re.compile(r"^(\d+)_([\w-]+)_(\d+)\.prof$")
+_active = threading.Lock()
+
+
+@contextmanager
+def profile_rerun(page: str):
+    """Profile the block when PROFILE_RERUNS=1 and no other rerun is being profiled."""
+    if not PROFILE_RERUNS or not _active.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield   # st.rerun() / st.stop() raise through here; those reruns are kept too
+    finally:
+        profiler.disable()
+        _active.release()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= PROFILE_MIN_MS:
+            try:
+                _save(profiler, page, elapsed_ms)
+            except OSError:
+                pass  # profiling must never break the page
+
+
+def _save(profiler: cProfile.Profile, page: str, elapsed_ms: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    page = re.sub(r"[^\w-]", "", page) or "page"
+    name = f"{int(time.time() * 1000)}_{page}_{int(elapsed_ms)}.prof"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    files = sorted(f for f in os.listdir(PROFILE_DIR) if _NAME.match(f))
+    for old in files[:max(len(files) - PROFILE_KEEP, 0)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles(limit: int = 20, since: float = None) -> list:
+    """Slowest stored reruns first: dicts with path, page, duration_ms, recorded_at (unix)."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        match = _NAME.match(name)
+        if not match:
+            continue
+        recorded_at = int(match.group(1)) / 1000
+        if since is not None and recorded_at < since:
+            continue
+        profiles.append({
+            "path": os.path.join(PROFILE_DIR, name),
+            "page": match.group(2),
+            "duration_ms": int(match.group(3)),
+            "recorded_at": recorded_at,
+        })
+    profiles.sort(key=lambda p: p["duration_ms"], reverse=True)
+    return profiles[:limit]
+
+
+def profile_report(path: str, limit: int = 30, sort: str = "cumulative") -> str:
+    """Top functions of a stored profile as pstats text."""
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -1,33 +1,102 @@
 """
 utils/sheets.py
 Google Sheets integration for syncing conversations.
+
+The authorized client and the spreadsheet/worksheet handles are cached for
+the whole process, so a sync is a single append call. The cache is dropped
+automatically on auth or not-found errors and the call is retried once.
+
+Real-time sync goes through a durable outbox: the chat/voice write path
+queues message ids in SQLite (save_message(..., outbox=True)) and the
+OutboxWorker thread drains it in batched append_rows calls with backoff.
+
+The manual "Sync" buttons push everything else incrementally: a persisted
+high-water mark (last synced message id) means each sync only uploads the
+new rows, in bounded chunks, and resumes where a failed run stopped.
 """
 import os
+import time
+import random
+import logging
+import threading
 import gspread
 from google.oauth2.service_account import Credentials
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
 from dotenv import load_dotenv
 from datetime import datetime
+from utils.database import (claim_outbox_batch, mark_outbox_delivered, mark_outbox_failed,
+                            get_messages_after, advance_sheets_watermark,
+                            get_sync_state, set_sync_state)
+from utils import metrics
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive"
 ]
 
 SHEET_HEADERS = ["ID", "Session ID", "Role", "Content", "Language", "Mode", "Timestamp", "Synced At"]
+WORKSHEET_TITLE = "Conversations"
+
+SYNC_CHUNK_SIZE = int(os.getenv("SHEETS_SYNC_CHUNK_SIZE", "500"))
+WATERMARK_KEY = "sheets.last_synced_id"
+INFLIGHT_KEY = "sheets.inflight_upto"   # chunk whose append outcome is unknown
+
+# HTTP statuses that mean the cached handles / token are no longer usable.
+_STALE_STATUSES = {401, 403, 404}
+
+_cache_lock = threading.RLock()
+_credentials = None
+_client = None
+_spreadsheets = {}   # sheet_id -> Spreadsheet
+_worksheets = {}     # (sheet_id, title) -> Worksheet
+_client_override = None  # injected client (fake backend), survives invalidation
+
+def sheets_enabled() -> bool:
+    return bool(os.getenv("GOOGLE_SHEET_ID"))
+
+def set_sheet_client(client):
+    """Install a ready-made client (e.g. fake_gspread.FakeClient); None restores real auth."""
+    global _client_override
+    with _cache_lock:
+        _client_override = client
+        invalidate_sheet_cache()
 
 def get_sheet_client():
-    """Authenticate and return gspread client."""
-    creds_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON", "credentials.json")
-    if not os.path.exists(creds_file):
-        raise FileNotFoundError(
-            f"Google credentials file '{creds_file}' not found. "
-            "Please follow setup instructions in README.md"
-        )
-    creds = Credentials.from_service_account_file(creds_file, scopes=SCOPES)
-    client = gspread.authorize(creds)
-    return client
+    """Authenticate and return the process-wide gspread client."""
+    global _credentials, _client, _client_override
+    with _cache_lock:
+        if _client is None and _client_override is None and os.getenv("GOOGLE_SHEETS_BACKEND") == "fake":
+            from utils.fake_gspread import FakeClient
+            _client_override = FakeClient(latency=float(os.getenv("FAKE_SHEETS_LATENCY_MS", "0")) / 1000)
+        if _client is None and _client_override is not None:
+            _client = _client_override
+        elif _client is None:
+            creds_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON", "credentials.json")
+            if not os.path.exists(creds_file):
+                raise FileNotFoundError(
+                    f"Google credentials file '{creds_file}' not found. "
+                    "Please follow setup instructions in README.md"
+                )
+            _credentials = Credentials.from_service_account_file(creds_file, scopes=SCOPES)
+            _client = gspread.authorize(_credentials)
+        elif _credentials is not None and not _credentials.valid:
+            # Refresh ahead of the call instead of eating a 401 round-trip.
+            _credentials.refresh(Request())
+        return _client
+
+def invalidate_sheet_cache():
+    """Forget the cached client and handles; the next call re-authorizes."""
+    global _credentials, _client
+    with _cache_lock:
+        _credentials = None
+        _client = None
+        _spreadsheets.clear()
+        _worksheets.clear()
 
 def get_or_create_worksheet(spreadsheet, title: str):
     """Get worksheet by title or create it."""
@@ -38,69 +107,250 @@ def get_or_create_worksheet(spreadsheet, title: str):
         ws.append_row(SHEET_HEADERS)
     return ws
 
-def sync_messages_to_sheet(messages: list) -> dict:
+def get_worksheet(sheet_id: str, title: str = WORKSHEET_TITLE):
+    """Return the cached worksheet handle, opening it on first use."""
+    with _cache_lock:
+        ws = _worksheets.get((sheet_id, title))
+        if ws is None:
+            spreadsheet = _spreadsheets.get(sheet_id)
+            if spreadsheet is None:
+                spreadsheet = get_sheet_client().open_by_key(sheet_id)
+                _spreadsheets[sheet_id] = spreadsheet
+            ws = get_or_create_worksheet(spreadsheet, title)
+            _worksheets[(sheet_id, title)] = ws
+        else:
+            get_sheet_client()  # refresh credentials if they expired
+        return ws
+
+def _status_code(e: Exception):
+    return getattr(getattr(e, "response", None), "status_code", None)
+
+def _is_stale_error(e: Exception) -> bool:
+    if isinstance(e, (RefreshError, gspread.WorksheetNotFound, gspread.SpreadsheetNotFound)):
+        return True
+    return _status_code(e) in _STALE_STATUSES
+
+def with_worksheet(sheet_id: str, action):
+    """
+    Run action(worksheet) against the cached handle.
+    On an auth / not-found error the cache is invalidated and the action retried once.
+    """
+    try:
+        return action(get_worksheet(sheet_id))
+    except Exception as e:
+        if not _is_stale_error(e):
+            raise
+        invalidate_sheet_cache()
+        return action(get_worksheet(sheet_id))
+
+def message_to_row(msg: dict, synced_at: str) -> list:
+    return [
+        msg.get("id", ""),
+        msg.get("session_id", ""),
+        msg.get("role", ""),
+        msg.get("content", ""),
+        msg.get("language", "en"),
+        msg.get("mode", "chat"),
+        msg.get("timestamp") or synced_at,
+        synced_at
+    ]
+
+def sync_messages_to_sheet(chunk_size: int = SYNC_CHUNK_SIZE, max_chunks: int = None) -> dict:
     """
-    Sync a list of message dicts to Google Sheets.
-    Returns a result dict with success/error info.
+    Push every message above the persisted high-water mark to Google Sheets,
+    chunk_size rows per append call. Messages owned by the outbox worker are
+    skipped. The watermark advances after each successful chunk, so a failed
+    run resumes from the last good chunk. Returns a result dict with
+    success/error info.
     """
     sheet_id = os.getenv("GOOGLE_SHEET_ID")
     if not sheet_id:
         return {"success": False, "error": "GOOGLE_SHEET_ID not set in .env"}
 
+    watermark = int(get_sync_state(WATERMARK_KEY, 0))
+    synced = 0
+    chunks = 0
     try:
-        client = get_sheet_client()
-        spreadsheet = client.open_by_key(sheet_id)
-        ws = get_or_create_worksheet(spreadsheet, "Conversations")
-
-        # Get existing IDs to avoid duplicates
-        existing = ws.col_values(1)  # Column A = ID
-        existing_ids = set(existing[1:])  # Skip header
-
-        rows_to_add = []
-        synced_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        for msg in messages:
-            if str(msg["id"]) not in existing_ids:
-                rows_to_add.append([
-                    msg["id"],
-                    msg["session_id"],
-                    msg["role"],
-                    msg["content"],
-                    msg["language"],
-                    msg["mode"],
-                    msg["timestamp"],
-                    synced_at
-                ])
-
-        if rows_to_add:
-            ws.append_rows(rows_to_add, value_input_option="USER_ENTERED")
-
-        return {"success": True, "synced": len(rows_to_add)}
+        # A previous run died between append and watermark update: that one
+        # chunk may already be in the sheet, so it is de-duplicated against
+        # column A before anything else is sent.
+        inflight = int(get_sync_state(INFLIGHT_KEY, 0))
+        present = get_synced_ids() if inflight > watermark else set()
+
+        while max_chunks is None or chunks < max_chunks:
+            batch = get_messages_after(watermark, chunk_size)
+            if not batch:
+                break
+            last_id = batch[-1]["id"]
+            to_send = [m for m in batch
+                       if not m["in_outbox"] and not (m["id"] <= inflight and str(m["id"]) in present)]
+            if to_send:
+                set_sync_state(INFLIGHT_KEY, last_id)
+                append_messages(to_send)
+            advance_sheets_watermark(WATERMARK_KEY, last_id)
+            watermark = last_id
+            synced += len(to_send)
+            chunks += 1
+
+        return {"success": True, "synced": synced, "watermark": watermark}
 
     except FileNotFoundError as e:
-        return {"success": False, "error": str(e)}
+        return {"success": False, "error": str(e), "synced": synced, "watermark": watermark}
     except Exception as e:
-        return {"success": False, "error": f"Google Sheets error: {str(e)}"}
+        return {"success": False, "error": f"Google Sheets error: {str(e)}",
+                "synced": synced, "watermark": watermark}
 
-def append_single_message(msg: dict) -> bool:
-    """Append a single message to Google Sheets in real time."""
+def append_messages(messages: list):
+    """Append a batch of message dicts in a single API call. Raises on failure."""
     sheet_id = os.getenv("GOOGLE_SHEET_ID")
     if not sheet_id:
+        raise RuntimeError("GOOGLE_SHEET_ID not set in .env")
+    synced_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [message_to_row(msg, synced_at) for msg in messages]
+    if rows:
+        with metrics.span("sheets.append"):
+            with_worksheet(sheet_id, lambda ws: ws.append_rows(rows, value_input_option="USER_ENTERED"))
+
+def append_single_message(msg: dict) -> bool:
+    """Append a single message to Google Sheets in real time."""
+    if not os.getenv("GOOGLE_SHEET_ID"):
         return False
     try:
-        client = get_sheet_client()
-        spreadsheet = client.open_by_key(sheet_id)
-        ws = get_or_create_worksheet(spreadsheet, "Conversations")
-        ws.append_row([
-            msg.get("id", ""),
-            msg.get("session_id", ""),
-            msg.get("role", ""),
-            msg.get("content", ""),
-            msg.get("language", "en"),
-            msg.get("mode", "chat"),
-            msg.get("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ], value_input_option="USER_ENTERED")
+        append_messages([msg])
         return True
     except Exception:
         return False
+
+def get_synced_ids() -> set:
+    """IDs already present in column A of the sheet (one read call)."""
+    with metrics.span("sheets.read_ids"):
+        return set(with_worksheet(os.getenv("GOOGLE_SHEET_ID"), lambda ws: ws.col_values(1))[1:])
+
+# ─────────────────────────────────────────────
+# Outbox worker
+# ─────────────────────────────────────────────
+class RateLimiter:
+    """Spaces calls at least 60/per_minute seconds apart."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, stop_event: threading.Event = None):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Drains the sheets_outbox table into Google Sheets.
+
+    - Batches of up to batch_size messages go out in one append_rows call.
+    - Failed batches are retried with exponential backoff plus jitter; a 429
+      additionally pauses the whole worker for the backoff period.
+    - Delivery is at least once: an entry that was claimed before (so the
+      earlier append may have landed) is first checked against column A of
+      the sheet and skipped if its id is already there.
+
+    `append` and `existing_ids` default to the real Sheets calls and can be
+    swapped for a fake in tests / benchmarks.
+    """
+
+    def __init__(self, append=None, existing_ids=None, batch_size: int = None,
+                 poll_interval: float = None, base_backoff: float = 2.0,
+                 max_backoff: float = 300.0, requests_per_minute: float = None,
+                 lease: float = 120.0):
+        super().__init__(name="sheets-outbox-worker", daemon=True)
+        self.append = append or append_messages
+        self.existing_ids = existing_ids or get_synced_ids
+        self.batch_size = batch_size or int(os.getenv("SHEETS_OUTBOX_BATCH_SIZE", "100"))
+        self.poll_interval = poll_interval or float(os.getenv("SHEETS_OUTBOX_POLL_SECONDS", "2"))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.rate_limiter = RateLimiter(
+            requests_per_minute or float(os.getenv("SHEETS_MAX_REQUESTS_PER_MINUTE", "50")))
+        self._stop_event = threading.Event()
+        self._paused_until = 0.0
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** max(attempts - 1, 0)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                drained = self.drain_once()
+            except Exception:
+                logger.exception("Sheets outbox drain failed")
+                drained = 0
+            if not drained:
+                self._stop_event.wait(self.poll_interval)
+
+    def drain_once(self) -> int:
+        """Deliver one batch. Returns the number of outbox entries handled."""
+        pause = self._paused_until - time.time()
+        if pause > 0:
+            self._stop_event.wait(pause)
+            return 0
+
+        batch = claim_outbox_batch(self.batch_size, self.lease)
+        claimed = len(batch)
+        if not batch:
+            return 0
+
+        try:
+            if any(m["attempts"] > 1 for m in batch):
+                self.rate_limiter.wait(self._stop_event)
+                present = self.existing_ids()
+                already = [m["id"] for m in batch if str(m["id"]) in present]
+                if already:
+                    mark_outbox_delivered(already)
+                batch = [m for m in batch if str(m["id"]) not in present]
+            if batch:
+                self.rate_limiter.wait(self._stop_event)
+                self.append(batch)
+        except Exception as e:
+            now = time.time()
+            if _status_code(e) == 429:
+                self._paused_until = now + self.backoff(max(m["attempts"] for m in batch))
+            mark_outbox_failed({m["id"]: now + self.backoff(m["attempts"]) for m in batch}, str(e))
+            logger.warning("Sheets outbox batch of %d failed: %s", len(batch), e)
+            return claimed
+
+        if batch:
+            mark_outbox_delivered([m["id"] for m in batch])
+        return claimed
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_outbox_worker(**kwargs) -> OutboxWorker:
+    """Start the process-wide outbox worker once (no-op without GOOGLE_SHEET_ID)."""
+    global _worker
+    with _worker_lock:
+        if (_worker is None or not _worker.is_alive()) and (sheets_enabled() or kwargs):
+            _worker = OutboxWorker(**kwargs)
+            _worker.start()
+        return _worker
+
+def stop_outbox_worker(timeout: float = None):
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop(timeout)
@@ -0,0 +1,110 @@
+"""
+utils/text.py
+Text normalization shared by the response cache and conversation search,
+language detection, and transcript stitching for chunked transcription.
+"""
+import re
+import unicodedata
+import numpy as np
+
+# Harakat, Quranic marks and superscript alef.
+ARABIC_DIACRITICS = "".join(
+    [chr(c) for c in range(0x0610, 0x061B)]
+    + [chr(c) for c in range(0x064B, 0x0660)]
+    + ["ٰ"]
+    + [chr(c) for c in range(0x06D6, 0x06EE)]
+)
+TATWEEL = "ـ"
+
+# Letter folding: alef variants -> bare alef, alef maqsura -> ya,
+# ta marbuta -> ha, hamza carriers -> their base letter.
+ARABIC_LETTER_FOLDS = {
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ة": "ه",
+    "ؤ": "و",
+}
+
+_FOLD_TABLE = str.maketrans({
+    **{c: None for c in ARABIC_DIACRITICS + TATWEEL},
+    **ARABIC_LETTER_FOLDS,
+    # Arabic-Indic and Eastern Arabic-Indic digits -> ASCII
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+})
+
+# Every Unicode block holding Arabic script: Arabic, Supplement, Extended-B/A,
+# Presentation Forms-A/B, Rumi numerals, Arabic mathematical symbols.
+ARABIC_BLOCKS = (
+    (0x0600, 0x06FF), (0x0750, 0x077F), (0x0870, 0x089F), (0x08A0, 0x08FF),
+    (0xFB50, 0xFDFF), (0xFE70, 0xFEFF), (0x10E60, 0x10E7F), (0x1EE00, 0x1EEFF),
+)
+# A text is Arabic when more than this share of its characters are Arabic script.
+ARABIC_RATIO = 0.2
+
+_ARABIC_CHARS = re.compile("[" + "".join(f"{chr(lo)}-{chr(hi)}" for lo, hi in ARABIC_BLOCKS) + "]+")
+
+_PUNCTUATION = re.compile(r"[^\w\s]+|_+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_arabic(text: str) -> str:
+    """Strip diacritics/tatweel and fold alef, ya, ta marbuta and hamza forms."""
+    return unicodedata.normalize("NFKC", text).translate(_FOLD_TABLE)
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Canonical form of a user prompt for cache keys / search:
+    Arabic folding, case folding, punctuation folded to spaces, whitespace collapsed.
+    "How do I reset my password?!" and "how do i reset my password" are equal.
+    """
+    text = normalize_arabic(text).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def merge_transcripts(parts: list, max_overlap_words: int = 12) -> str:
+    """
+    Join chunk transcripts in order, dropping words repeated across a chunk
+    boundary (chunks overlap slightly, so the tail of one transcript often
+    reappears at the head of the next). Words are compared in normalized form.
+    """
+    merged = []
+    for part in parts:
+        words = part.split()
+        if merged and words:
+            tail = [normalize_prompt(w) for w in merged[-max_overlap_words:]]
+            head = [normalize_prompt(w) for w in words[:max_overlap_words]]
+            for k in range(min(len(tail), len(head)), 0, -1):
+                if tail[-k:] == head[:k]:
+                    words = words[k:]
+                    break
+        merged.extend(words)
+    return " ".join(merged)
+
+
+def detect_language(text: str) -> str:
+    """'ar' if more than ARABIC_RATIO of the characters are Arabic script, else 'en'."""
+    arabic = len(text) - len(_ARABIC_CHARS.sub("", text))
+    return "ar" if arabic > len(text) * ARABIC_RATIO else "en"
+
+
+def detect_languages(texts: list) -> list:
+    """
+    detect_language for many texts at once: the batch is decoded into one
+    UTF-32 code point array and the Arabic share of every text comes from a
+    single cumulative-sum pass instead of a Python loop per character.
+    """
+    if not texts:
+        return []
+    texts = [t or "" for t in texts]
+    codepoints = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    is_arabic = np.zeros(len(codepoints), dtype=bool)
+    for lo, hi in ARABIC_BLOCKS:
+        is_arabic |= (codepoints >= lo) & (codepoints <= hi)
+    running = np.concatenate(([0], np.cumsum(is_arabic, dtype=np.int64)))
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    ends = np.cumsum(lengths)
+    arabic = running[ends] - running[ends - lengths]
+    return np.where(arabic > lengths * ARABIC_RATIO, "ar", "en").tolist()
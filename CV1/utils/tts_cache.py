@@ -0,0 +1,149 @@
+"""
+utils/tts_cache.py
+Content-addressed on-disk cache for synthesized speech.
+
+Files live at <TTS_CACHE_DIR>/<lang>/<sha256[:2]>/<sha256>.mp3, keyed by the
+language and the exact text. The directory is capped at TTS_CACHE_MAX_MB and
+the least recently used files (by mtime, bumped on every hit) are evicted.
+"""
+import os
+import hashlib
+import threading
+
+TTS_CACHE_DIR = os.getenv(
+    "TTS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "tts_cache")
+)
+TTS_CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# Phrases worth synthesizing ahead of time (greetings, escalation, closings).
+COMMON_PHRASES = {
+    "en": [
+        "Hi! How can we help you today?",
+        "Thank you for contacting support.",
+        "Thank you for your feedback!",
+        "I'm sorry for the inconvenience.",
+        "A specialist will contact you within 24 hours.",
+        "Is there anything else I can help you with?",
+        "You can reset your password from the login screen by selecting Forgot password.",
+        "You can cancel your subscription at any time from the Account page.",
+    ],
+    "ar": [
+        "مرحبًا! كيف يمكننا مساعدتك اليوم؟",
+        "شكرًا لتواصلك مع الدعم.",
+        "شكرًا على ملاحظاتك!",
+        "نعتذر عن الإزعاج.",
+        "سيتواصل معك متخصص خلال 24 ساعة.",
+        "هل هناك أي شيء آخر يمكنني مساعدتك به؟",
+        "يمكنك إعادة تعيين كلمة المرور من شاشة تسجيل الدخول باختيار نسيت كلمة المرور.",
+        "يمكنك إلغاء اشتراكك في أي وقت من صفحة الحساب.",
+    ],
+}
+
+
+class TTSCache:
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None   # computed lazily from disk
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def key(self, language: str, text: str) -> str:
+        return hashlib.sha256(f"{language}\0{text.strip()}".encode("utf-8")).hexdigest()
+
+    def path(self, language: str, text: str) -> str:
+        digest = self.key(language, text)
+        return os.path.join(self.directory, language, digest[:2], digest + ".mp3")
+
+    def get(self, language: str, text: str):
+        """Return cached MP3 bytes or None."""
+        path = self.path(language, text)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # LRU: most recently used = newest mtime
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += len(audio)
+        return audio
+
+    def put(self, language: str, text: str, audio: bytes):
+        path = self.path(language, text)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            self._disk_usage()  # first put: size the directory before this file joins it
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)  # atomic: readers never see a partial file
+        with self._lock:
+            total = self._total_bytes + len(audio) - previous
+            self._total_bytes = total
+        if total > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_ratio: float = 0.9):
+        """Delete least recently used files until usage is under target_ratio * cap."""
+        with self._lock:
+            files = list(self._files())
+            total = sum(size for _, size, _ in files)
+            target = self.max_bytes * target_ratio
+            for path, size, _ in sorted(files, key=lambda f: f[2]):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._total_bytes = total
+
+    def prewarm(self, synthesize, phrases: dict = None) -> int:
+        """
+        Synthesize any missing phrases ahead of time.
+        synthesize(text, language) -> bytes; phrases defaults to COMMON_PHRASES.
+        Returns how many new entries were written.
+        """
+        written = 0
+        for language, texts in (phrases or COMMON_PHRASES).items():
+            for text in texts:
+                if not os.path.exists(self.path(language, text)):
+                    self.put(language, text, synthesize(text, language))
+                    written += 1
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "disk_bytes": self._disk_usage(),
+            }
+
+    def _disk_usage(self) -> int:
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._files())
+        return self._total_bytes
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".mp3"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
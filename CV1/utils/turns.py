@@ -0,0 +1,88 @@
+"""
+utils/turns.py
+One support turn (chat or voice) without any Streamlit code: detect the
+language, save the messages, stream the reply, queue it for Google Sheets and
+record the turn timing. Metrics spans recorded during a turn are tagged with
+its session, language and mode. pages/chat_page.py and pages/voice_page.py render
+around these generators; benchmarks/load_test.py drives them directly.
+"""
+from utils.ai_engine import chat_with_gpt_stream, detect_language, transcribe_audio
+from utils.voice_pipeline import stream_voice_reply
+from utils.database import save_message_async, save_turn_timing
+from utils.sheets import sheets_enabled
+from utils import metrics
+
+
+def chat_turn(session_id: str, history: list, prompt: str, language: str = "en", result: dict = None):
+    """
+    Yield reply deltas for `prompt`. history ({"role", "content"} dicts) gets
+    the user and assistant messages appended. Once exhausted, result holds
+    reply, language, message_id and timings (ttft_ms, total_ms, cache_hit).
+    """
+    result = result if result is not None else {}
+    detected_lang = detect_language(prompt)
+    active_lang = detected_lang if detected_lang != language else language
+
+    with metrics.tagged(session_id=session_id, language=active_lang, mode="chat"):
+        history.append({"role": "user", "content": prompt})
+        save_message_async(session_id, "user", prompt, active_lang, "chat")
+
+        timings = {}
+        parts = []
+        for delta in chat_with_gpt_stream(list(history), active_lang, timings, session_id=session_id):
+            parts.append(delta)
+            yield delta
+        reply = "".join(parts).strip()
+        history.append({"role": "assistant", "content": reply})
+
+        # Save assistant message (and queue it for the Google Sheets worker)
+        reply_id = save_message_async(session_id, "assistant", reply, active_lang, "chat",
+                                      outbox=sheets_enabled())
+        message_id = reply_id.result()
+        save_turn_timing(session_id, message_id, timings.get("ttft_ms"), timings.get("total_ms"), "chat")
+    result.update(reply=reply, language=active_lang, message_id=message_id, timings=timings)
+
+
+def voice_turn(session_id: str, history: list, audio_bytes: bytes, filename: str = "audio.wav",
+               language: str = "en", result: dict = None, saved_user_text: str = None):
+    """
+    Transcribe an upload and voice the reply. Yields ("transcript", text)
+    once the user message is saved, then ("segment", (sentence, mp3_bytes))
+    pairs in reply order (mp3_bytes is None when that sentence could not be
+    voiced). Once exhausted, result holds user_text, reply, language, message_id,
+    audio_stats and timings (first_audio_ms, total_audio_ms, ...).
+
+    saved_user_text retries a turn whose reply failed: that transcript is
+    already saved and in history, so only the reply is generated.
+    """
+    result = result if result is not None else {}
+    audio_stats = {}
+    if saved_user_text is None:
+        with metrics.tagged(session_id=session_id, language=language, mode="voice"):
+            user_text = transcribe_audio(audio_bytes, language, filename=filename, stats=audio_stats)
+    else:
+        user_text = saved_user_text
+    active_lang = detect_language(user_text)
+    result.update(user_text=user_text, language=active_lang, audio_stats=audio_stats)
+
+    with metrics.tagged(session_id=session_id, language=active_lang, mode="voice"):
+        if saved_user_text is None:
+            save_message_async(session_id, "user", user_text, active_lang, "voice")
+            history.append({"role": "user", "content": user_text})
+        yield "transcript", user_text
+
+        timings = {}
+        sentences = []
+        for sentence, tts_audio in stream_voice_reply(list(history), active_lang, session_id, timings):
+            sentences.append(sentence)
+            yield "segment", (sentence, tts_audio)
+        reply = " ".join(sentences)
+        history.append({"role": "assistant", "content": reply})
+
+        reply_id = save_message_async(session_id, "assistant", reply, active_lang, "voice",
+                                      outbox=sheets_enabled())
+        message_id = reply_id.result()
+        # Perceived latency for voice = time until the first audio segment
+        save_turn_timing(session_id, message_id, timings.get("first_audio_ms"),
+                         timings.get("total_audio_ms"), "voice")
+    result.update(reply=reply, message_id=message_id, timings=timings)
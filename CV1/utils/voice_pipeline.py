@@ -0,0 +1,112 @@
+"""
+utils/voice_pipeline.py
+Pipelined voice reply: stream the LLM answer, cut it into sentences as they
+complete, synthesize each sentence on a worker pool while the model keeps
+generating, and hand audio segments back in order as soon as they are ready.
+
+Time to first audio is roughly "first sentence generated + synthesized"
+instead of "whole reply generated + whole reply synthesized".
+"""
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.ai_engine import chat_with_gpt_stream, text_to_speech
+from utils import metrics
+
+TTS_WORKERS = int(os.getenv("VOICE_TTS_WORKERS", "4"))
+# Very short fragments ("Hi.", "1.") are merged into the next sentence so
+# each TTS request carries a useful amount of speech.
+MIN_SENTENCE_CHARS = int(os.getenv("VOICE_MIN_SENTENCE_CHARS", "25"))
+
+# Sentence terminators: Latin . ! ? …, Arabic question mark ؟, Arabic full
+# stop ۔, Arabic semicolon ؛ and line breaks. A terminator only ends a
+# sentence when followed by whitespace and then a character that is not a
+# lowercase Latin letter, so "2.5" and "e.g. on TV" stay intact. While
+# streaming, a cut therefore waits for the first character of the next sentence.
+_SENTENCE_END = re.compile(r"([.!?…؟۔؛]+[\"'”’)\]]*)(\s+)(?=[^\sa-z])|(\n+)")
+
+_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="voice-tts")
+
+
+class SentenceSplitter:
+    """Incremental sentence splitter for streamed text."""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> list:
+        """Add a delta; return the sentences it completed."""
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+            candidate = self._buffer[start:end].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = end
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> list:
+        """Return whatever is left once the stream has ended."""
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def split_sentences(text: str, min_chars: int = MIN_SENTENCE_CHARS) -> list:
+    splitter = SentenceSplitter(min_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+def _speak(sentence: str, language: str) -> bytes:
+    # One span per segment, cache hits included; a failure is recorded with ok=0
+    with metrics.span("tts.segment"):
+        return text_to_speech(sentence, language)
+
+
+def stream_voice_reply(messages: list, language: str = "en", session_id: str = None,
+                       timings: dict = None):
+    """
+    Yield (sentence, mp3_bytes) pairs in reply order while the reply is still
+    being generated. A sentence whose synthesis failed is yielded with None
+    audio so the reply text is still complete.
+
+    timings (optional dict) receives the LLM ttft_ms / total_ms plus
+    first_audio_ms (time until the first segment was ready) and total_audio_ms.
+    The full reply text is " ".join of the yielded sentences.
+    """
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+    splitter = SentenceSplitter()
+    pending = deque()   # futures in sentence order
+    synthesize = metrics.bind(_speak)   # TTS spans keep this turn's tags
+
+    def ready_segments(block: bool):
+        while pending and (block or pending[0][1].done()):
+            sentence, future = pending.popleft()
+            try:
+                audio = future.result()
+            except Exception:
+                audio = None   # already recorded as a failed tts.segment span
+            if "first_audio_ms" not in timings:
+                timings["first_audio_ms"] = (time.perf_counter() - started) * 1000
+            yield sentence, audio
+
+    try:
+        for delta in chat_with_gpt_stream(messages, language, timings,
+                                          session_id=session_id, mode="voice"):
+            for sentence in splitter.feed(delta):
+                pending.append((sentence, _pool.submit(synthesize, sentence, language)))
+            yield from ready_segments(block=False)
+
+        for sentence in splitter.flush():
+            pending.append((sentence, _pool.submit(synthesize, sentence, language)))
+        yield from ready_segments(block=True)
+    finally:
+        for _, future in pending:
+            future.cancel()
+    timings["total_audio_ms"] = (time.perf_counter() - started) * 1000
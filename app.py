@@ -20,6 +20,10 @@ st.set_page_config(
 from utils.database import init_db
 init_db()
 
+# ── Background Google Sheets sync (idempotent across reruns) ──────────────────
+from utils.sheets import start_outbox_worker
+start_outbox_worker()
+
 # ── Sidebar ────────────────────────────────────────────────────────────────────
 with st.sidebar:
     st.image("https://img.icons8.com/fluency/96/tv-show.png", width=80)
@@ -50,24 +54,34 @@ with st.sidebar:
     st.caption(f"Session: `{st.session_state.session_id}`")
 
     if st.button("🔄 New Session"):
-        for key in ["session_id", "messages", "voice_response"]:
+        for key in ["session_id", "messages", "voice_response", "voice_messages", "voice_processed"]:
             if key in st.session_state:
                 del st.session_state[key]
         st.rerun()
 
 # ── Page routing ───────────────────────────────────────────────────────────────
+# PROFILE_RERUNS=1 saves a cProfile of slow reruns (utils/profiler.py)
+from utils.profiler import profile_rerun
 if "🏠 Support Chat" in page:
-    if mode_key == "chat":
+    page_key = mode_key
+elif "📊 Dashboard" in page:
+    page_key = "dashboard"
+else:
+    page_key = "about"
+
+with profile_rerun(page_key):
+    if page_key == "chat":
         from pages.chat_page import render_chat
         render_chat(language, st.session_state.session_id)
-    else:
+
+    elif page_key == "voice":
         from pages.voice_page import render_voice
         render_voice(language, st.session_state.session_id)
 
-elif "📊 Dashboard" in page:
-    from pages.dashboard_page import render_dashboard
-    render_dashboard()
+    elif page_key == "dashboard":
+        from pages.dashboard_page import render_dashboard
+        render_dashboard()
 
-elif "ℹ️ About" in page:
-    from pages.about_page import render_about
-    render_about()
+    elif page_key == "about":
+        from pages.about_page import render_about
+        render_about()